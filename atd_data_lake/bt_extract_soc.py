@@ -3,12 +3,12 @@ Publish Bluetooth "Ready" Data Lake data
 
 @author Kenneth Perrine, Nadia Florez
 """
-import hashlib
+import hashlib, os
 
 import arrow
 
 import _setpath
-from atd_data_lake.support import etl_app, last_update
+from atd_data_lake.support import etl_app, last_update, json_stream
 from atd_data_lake import config
 
 # This sets up application information:
@@ -20,6 +20,11 @@ class BTPublishApp(etl_app.ETLApp):
     """
     Application functions and special behavior around Bluetooth exporting to Socrata.
     """
+    # The daily device address counter and the publishers are shared between items.
+    parallelItems = False
+    # Resuming partway through a day would restart the daily device address counter.
+    resumableItems = False
+    
     def __init__(self, args):
         """
         Initializes application-specific variables
@@ -68,19 +73,28 @@ class BTPublishApp(etl_app.ETLApp):
         # Read in the file and call the transformation code.
         fileType = item.identifier.ext.split(".")[0] # Get string up to the file type extension.
         print("%s: %s -> %s" % (item.label, self.storageSrc.repository, self.publishers[fileType].connector.getIdentifier()))
-        data = self.storageSrc.retrieveJSON(item.label)
-        
+        # The devices come after the data rows, so the file is read through twice rather than being held in memory:
+        filePath = self.storageSrc.retrieveFilePath(item.label)
+        try:
+            return self._publishFile(item, fileType, filePath)
+        finally:
+            os.remove(filePath)
+
+    def _publishFile(self, item, fileType, filePath):
+        """
+        Publishes the contents of the given retrieved file and records it in the catalog.
+        """
         # These variables will keep track of the device counter that gets reset daily:
         if item.identifier.date != self.prevDate:
             self.addrLookup = {}
             self.addrLookupCounter = 0
         
         # Generate device lookup:
-        devices = {d["device_id"]: d for d in data["devices"]}
+        devices = {d["device_id"]: d for d in json_stream.readSections(filePath, ["devices"])["devices"]}
         
         # Assemble JSON for Socrata
         publisher = self.publishers[fileType]
-        for line in data["data"]:
+        for line in json_stream.iterRows(filePath):
             entry = None
             hashFields = None
             
@@ -19,6 +19,9 @@ class BTJSONStandardApp(etl_app.ETLApp):
     """
     Application functions and special behavior around Bluetooth JSON canonicalization.
     """
+    # Unit data is written with the first item, and sensor observations are shared.
+    parallelItems = False
+    
     def __init__(self, args):
         """
         Initializes application-specific variables
@@ -37,8 +40,7 @@ class BTJSONStandardApp(etl_app.ETLApp):
         @return count: A general number of records processed
         """
         # First, get the unit data for Bluetooth:
-        unitDataProv = config.createUnitDataAccessor(self.dataSource)
-        self.unitData = unitDataProv.retrieve()
+        self.unitData = self.retrieveUnitData()
                 
         # Configure the source and target repositories and start the compare loop:
         count = self.doCompareLoop(last_update.LastUpdStorageCatProv(self.storageSrc),
@@ -63,16 +65,16 @@ class BTJSONStandardApp(etl_app.ETLApp):
         print("%s: %s -> %s" % (item.label, self.storageSrc.repository, self.storageTgt.repository))
         filepathSrc = self.storageSrc.retrieveFilePath(item.label)
         fileType = item.identifier.ext.split(".")[0] # Get string up to the file type extension.
-        outJSON, perfWork = btStandardize(item, filepathSrc,
+        header, rows, perfWork = btStandardize(item, filepathSrc,
             self.storageTgt.makeFilename(item.identifier.base, fileType + ".json", item.identifier.date), fileType, self.processingDate)
 
-        # Clean up:
-        os.remove(filepathSrc)
-        
-        # Prepare for writing to the target:
+        # Write to the target as the rows are read in:
         catalogElement = self.storageTgt.createCatalogElement(item.identifier.base, fileType + ".json",
                                                               item.identifier.date, self.processingDate)
-        self.storageTgt.writeJSON(outJSON, catalogElement)
+        self.storageTgt.writeJSONStream(header, rows, catalogElement)
+
+        # Clean up:
+        os.remove(filepathSrc)
             
         # Final stages:
         self.perfmet.recordCollect(item.identifier.date, representsDay=True)
@@ -105,7 +107,8 @@ def _parseTimeShort(inTime):
 
 def btStandardize(storageItem, filepathSrc, filenameTgt, fileType, processingDate):
     """
-    Performs the actual Bluetooth standardization. Retrns data buffer and performance metrics work.
+    Performs the actual Bluetooth standardization. Returns the header, an iterator of data rows that are read in as they
+    are consumed, and performance metrics work, which is complete once all rows are consumed.
     """
     # Step 1: Define data columns:
     if fileType == "unmatched":
@@ -132,16 +135,23 @@ def btStandardize(storageItem, filepathSrc, filenameTgt, fileType, processingDat
                   "collection_date": str(storageItem.identifier.date),
                   "processing_date": str(processingDate)}
 
-    # Step 3: Read in the file and parse dates as we read:
-    data = []
+    # Step 3: The file is read in and dates are parsed as rows are consumed:
     perfWork = {} # This will be sensor -> [count, minTime, maxTime]
+    rows = _btReadRows(filepathSrc, fileType, btDataColumns, btDateColumns, perfWork)
+    return jsonHeader, perfmet.timedIter("transform", rows), perfWork
+
+def _btReadRows(filepathSrc, fileType, btDataColumns, btDateColumns, perfWork):
+    """
+    Generator that reads in the Bluetooth file and yields each row with parsed dates, collecting performance metrics
+    work along the way.
+    """
     with open(filepathSrc, "rt") as fileReader:
         reader = csv.DictReader(fileReader, fieldnames=btDataColumns)
         try:
             for row in reader:
                 for col in btDateColumns[0]:
                     row[col] = btDateColumns[1](row[col])
-                data.append(row)
+                yield row
                 
                 # Performance metrics:
                 if fileType == "unmatched":
@@ -157,11 +167,6 @@ def btStandardize(storageItem, filepathSrc, filenameTgt, fileType, processingDat
                                 recs[2] = row["host_timestamp"]
         except csv.Error:
             print("WARNING: CSV reader encountered an error. Stopping reading.")
-                
-    # We're complete!
-    ret = {"header": jsonHeader,
-           "data": data}
-    return ret, perfWork 
 
 def main(args=None):
     """
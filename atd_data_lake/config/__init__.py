@@ -7,6 +7,9 @@ platform-independent accessors for storage and catalog objects.
 from atd_data_lake.config import config_app
 from atd_data_lake.support import storage, catalog, unitdata, perfmet, publish
 
+_handoff = None
+_objectCache = None
+
 def getUnitLocation():
     """
     Returns the unit location as defined in the configuration
@@ -46,14 +49,36 @@ def createStorage(catalog, purpose, dataSource, tempDir=None, simulationMode=Fal
     """
     repository = getRepository(purpose)
     storageConn = config_app.createStorageConn(repository)
-    return storage.Storage(storageConn, repository, dataSource, catalog, tempDir, simulationMode, writeFilePath)
+    return storage.Storage(storageConn, repository, dataSource, catalog, tempDir, simulationMode, writeFilePath, handoff=_handoff,
+                           objectCache=getObjectCache(), encoding=config_app.STORAGE_ENCODING)
+
+def getObjectCache():
+    """
+    Returns the local object cache that all storage objects share, or None if one isn't configured
+    """
+    global _objectCache
+    
+    if _objectCache is None:
+        _objectCache = config_app.createObjectCache()
+    return _objectCache
+
+def setHandoff(handoff):
+    """
+    Sets a handoff.Handoff that all storage objects created afterward will share, or None to stop sharing
+    """
+    global _handoff
+    
+    _handoff = handoff
     
 def createCatalog(dataSource):
     """
     Returns a new catalog object implemented according to defs in config_app.py
     """
     catalogConn = config_app.createCatalogConn()
-    return catalog.Catalog(catalogConn, dataSource)
+    return catalog.Catalog(catalogConn, dataSource, snapshot=config_app.createCatalogSnapshot(catalogConn),
+                           batchRows=config_app.CATALOG_UPSERT_BATCH_ROWS, batchBytes=config_app.CATALOG_UPSERT_BATCH_BYTES,
+                           retries=config_app.CATALOG_UPSERT_RETRIES, upsertWorkers=config_app.CATALOG_UPSERT_WORKERS,
+                           readAhead=config_app.CATALOG_READ_AHEAD)
     
 def createPerfmet(stageName, dataSource):
     """
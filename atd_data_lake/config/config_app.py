@@ -5,7 +5,8 @@ config_app.py contains application-specific configurations.
 """
 from atd_data_lake.config import config_secret, config_support
 
-from atd_data_lake.drivers import storage_s3, catalog_postgrest, perfmet_postgrest, publish_socrata
+from atd_data_lake.support import catalog_snapshot, object_cache
+from atd_data_lake.drivers import storage_s3, catalog_postgrest, catalog_sqlite, perfmet_postgrest, postgrest_pool, publish_socrata
 from atd_data_lake.drivers.devices import bt_unitdata_knack, wt_unitdata_knack, gs_unitdata_knack
 
 # ** These project-wide items are independent of specific devices: **
@@ -35,9 +36,39 @@ DATASOURCE_MAP = {"bt": config_support.DataSourceConfig(code="bt", name="Bluetoo
 CATALOG_URL = "http://transportation-data-test.austintexas.io/data_lake_cat_new"
 CATALOG_KEY = getattr(config_secret, "CATALOG_KEY", "")
 
+"Catalog backend: \"postgrest\" for the shared catalog at CATALOG_URL, or \"sqlite\" for a local file at CATALOG_SQLITE_PATH"
+CATALOG_TYPE = "postgrest"
+CATALOG_SQLITE_PATH = "catalog.sqlite"
+
+"Directory for local catalog snapshot files that speed up repeated queries, or None to always query the catalog"
+CATALOG_SNAPSHOT_DIR = None
+
+"Directory for a local cache of retrieved storage objects that is shared by all runs, or None to not cache; the cache is kept within OBJECT_CACHE_MAX_BYTES, and objects larger than OBJECT_CACHE_MAX_OBJECT_BYTES aren't cached"
+OBJECT_CACHE_DIR = None
+OBJECT_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+OBJECT_CACHE_MAX_OBJECT_BYTES = 64 * 1024 * 1024
+
+"Compression for JSON that is written to the Data Lake: None, \"gzip\", or \"zstd\" (needs the zstandard package); what is already there is read either way"
+STORAGE_ENCODING = None
+
+"Catalog upsert batching: maximum elements and approximate JSON bytes per request, retries, and concurrent requests"
+CATALOG_UPSERT_BATCH_ROWS = 1000
+CATALOG_UPSERT_BATCH_BYTES = 1000000
+CATALOG_UPSERT_RETRIES = 3
+CATALOG_UPSERT_WORKERS = 1
+
+"Set to True to have catalog queries fetch the next page of results in the background while the current one is used"
+CATALOG_READ_AHEAD = False
+
+"Number of keep-alive connections per host that are shared among the catalog and perfmet PostgREST connectors"
+POSTGREST_POOL_SIZE = 10
+
 PERFMET_JOB_URL = "http://transportation-data-test.austintexas.io/etl_perfmet_job"
 PERFMET_OBS_URL = "http://transportation-data-test.austintexas.io/etl_perfmet_obs"
 
+"Set to True to write phase timings with each job; requires a JSON \"metadata\" column in the etl_perfmet_job table"
+PERFMET_JOB_METADATA = False
+
 KNACK_API_KEY = getattr(config_secret, "KNACK_API_KEY", "")
 KNACK_APP_ID = getattr(config_secret, "KNACK_APP_ID", "")
 
@@ -46,6 +77,12 @@ KNACK_PERFMET_ID = getattr(config_secret, "KNACK_PERFMET_ID", "")
 AWS_KEY_ID = getattr(config_secret, "AWS_KEY_ID", "")
 AWS_SECRET_KEY = getattr(config_secret, "AWS_SECRET_KEY", "")
 
+"S3 transfers: objects of at least S3_MULTIPART_THRESHOLD bytes move in S3_PART_SIZE parts, S3_TRANSFER_CONCURRENCY at a time, with each part tried up to S3_PART_ATTEMPTS times"
+S3_MULTIPART_THRESHOLD = 16 * 1024 * 1024
+S3_PART_SIZE = 16 * 1024 * 1024
+S3_TRANSFER_CONCURRENCY = 4
+S3_PART_ATTEMPTS = 5
+
 SOC_HOST = "data.austintexas.gov"
 SOC_IDENTIFIER = "datalake"
 SOC_APP_TOKEN = getattr(config_secret, "SOC_APP_TOKEN", "")
@@ -76,19 +113,43 @@ def createStorageConn(repository):
     """
     if not storage_s3.isAWS_S3_Configured():
         storage_s3.configAWS_S3(AWS_KEY_ID, AWS_SECRET_KEY)
+        storage_s3.configTransfer(S3_MULTIPART_THRESHOLD, S3_PART_SIZE, S3_TRANSFER_CONCURRENCY, S3_PART_ATTEMPTS)
     return storage_s3.StorageS3(repository)
     
 def createCatalogConn():
     """
     Returns a new catalog connector object
     """
+    if CATALOG_TYPE == "sqlite":
+        return catalog_sqlite.CatalogSQLite(CATALOG_SQLITE_PATH)
+    if not postgrest_pool.isPoolConfigured():
+        postgrest_pool.configPool(POSTGREST_POOL_SIZE)
     return catalog_postgrest.CatalogPostgREST(CATALOG_URL, CATALOG_KEY)
+
+def createCatalogSnapshot(catalogConn):
+    """
+    Returns a new local catalog snapshot object that fronts the given catalog connector, or None if not configured
+    """
+    if not CATALOG_SNAPSHOT_DIR:
+        return None
+    return catalog_snapshot.CatalogSnapshot(catalogConn, CATALOG_SNAPSHOT_DIR)
+    
+def createObjectCache():
+    """
+    Returns a new local object cache for storage retrievals, or None if not configured
+    """
+    if not OBJECT_CACHE_DIR:
+        return None
+    return object_cache.ObjectCache(OBJECT_CACHE_DIR, OBJECT_CACHE_MAX_BYTES, OBJECT_CACHE_MAX_OBJECT_BYTES)
     
 def createPerfmetConn():
     """
     Returns a new perfmet connector object
     """
-    return perfmet_postgrest.PerfMetDB(PERFMET_JOB_URL, PERFMET_OBS_URL, CATALOG_KEY, needsObs=True)
+    if not postgrest_pool.isPoolConfigured():
+        postgrest_pool.configPool(POSTGREST_POOL_SIZE)
+    return perfmet_postgrest.PerfMetDB(PERFMET_JOB_URL, PERFMET_OBS_URL, CATALOG_KEY, needsObs=True,
+                                       jobMetadata=PERFMET_JOB_METADATA)
 
 def createUnitDataConn(dataSource, areaBase):
     """
@@ -4,7 +4,7 @@ catalog_postgrest.py: Catalog functions facilitated by calls to PostgREST
 Kenneth Perrine
 Center for Transportation Research, The University of Texas at Austin
 """
-from pypgrest import Postgrest
+from atd_data_lake.drivers.postgrest_pool import PostgrestPooled
 
 "PREFERRED_CHUNK_SIZE is the number of records that are preferred to be returned in a multi-record query."
 PREFERRED_CHUNK_SIZE = 10000
@@ -17,17 +17,21 @@ class CatalogPostgREST:
         """
         Initializes the PostgREST access with a given access point URL and the API key.
         """
-        self.catalogDB = Postgrest(accessPoint, auth=apiKey)
+        self.catalogDB = PostgrestPooled(accessPoint, auth=apiKey)
         
-    def query(self, dataSource, stage, base, ext, earlyDate=None, lateDate=None, exactEarlyDate=False, limit=None, start=None, reverse=False):
+    def query(self, dataSource, stage, base, ext, earlyDate=None, lateDate=None, exactEarlyDate=False, limit=None, start=None, reverse=False,
+              after=None, processedSince=None):
         """
         Performs a query on the given datatype, data stage, base, ext, and optional early and late dates. Returns a list
-        of dictionary objects, each a result.
+        of dictionary objects, each a result. The base and ext may also be given as lists of exact values to match.
         
         @param exactEarlyDate: Set this to true to query only on exact date defined by the earlyDate parameter
         @param limit Limits the output to a specific number of records. If None, then the driver default is used.
         @param start sets the start frome wnen doing a multi-chunk query.
         @param reverse will allow the results to be sorted in descending order.
+        @param after: A (collection_date, id_base, id_ext) tuple of the last row of the previous chunk; results are then
+            the rows that come after it in sort order. This is preferred over start for multi-chunk queries.
+        @param processedSince: If specified, only returns entries with a processing_date on or after this date.
         """
         # TODO: Do we need a query that will return a catalog entry that contains a given collection date (between collection_date
         # and collection_end)?
@@ -40,13 +44,17 @@ class CatalogPostgREST:
             "limit": 1 if limit is None else limit,
             "offset": 0 if start is None else start}
         
-        # Allow base and ext identifiers to be omitted, or to be a "match first part of string" query:
-        if base is not None:
+        # Allow base and ext identifiers to be omitted, or to be a "match first part of string" query, or a list of choices:
+        if isinstance(base, (list, tuple, set, frozenset)):
+            command["id_base"] = "in.(%s)" % ",".join(_quote(x) for x in base)
+        elif base is not None:
             if "%%" in base:
                 command["id_base"] = "like.%s" % base.replace("%%", "*")
             else:
                 command["id_base"] = "eq.%s" % base
-        if ext is not None:
+        if isinstance(ext, (list, tuple, set, frozenset)):
+            command["id_ext"] = "in.(%s)" % ",".join(_quote(x) for x in ext)
+        elif ext is not None:
             if "%%" in ext:
                 command["id_ext"] = "like.%s" % ext.replace("%%", "*")
             else:
@@ -66,6 +74,17 @@ class CatalogPostgREST:
                 command["collection_date"] = collDateRange[0]
             else:
                 command["collection_date"] = collDateRange
+
+        # Keyset pagination: continue after the last row of the previous chunk, according to the sort order:
+        if after is not None:
+            collDate, afterBase, afterExt = (_quote(str(x)) for x in after)
+            command["or"] = "(collection_date.{op}.{date},and(collection_date.eq.{date},id_base.gt.{base})," \
+                "and(collection_date.eq.{date},id_base.eq.{base},id_ext.gt.{ext}))".format(op="lt" if reverse else "gt",
+                date=collDate, base=afterBase, ext=afterExt)
+
+        # Processing date lower bound, used for incremental synchronization:
+        if processedSince is not None:
+            command["processing_date"] = "gte.%s" % str(processedSince)
                 
         # Run the query:
         return self.catalogDB.select(params=command)
@@ -79,8 +98,12 @@ class CatalogPostgREST:
         try:
             self.catalogDB.upsert(upsertDataList)
         except:
-            print("ERROR: Exception encountered in CatalogPostgREST.upsert(). Input:")
-            print(upsertDataList)
+            if isinstance(upsertDataList, list):
+                print("ERROR: Exception encountered in CatalogPostgREST.upsert() for %d element(s), starting with:" % len(upsertDataList))
+                print(upsertDataList[0] if upsertDataList else None)
+            else:
+                print("ERROR: Exception encountered in CatalogPostgREST.upsert(). Input:")
+                print(upsertDataList)
             raise
     
     @staticmethod
@@ -89,3 +112,9 @@ class CatalogPostgREST:
         Retruns the preferred chunk size that catalog.Catalog.query() should used in requests.
         """
         return PREFERRED_CHUNK_SIZE
+
+def _quote(value):
+    """
+    Quotes a value for use within a PostgREST logical operator expression, where reserved characters may occur.
+    """
+    return '"%s"' % value.replace("\\", "\\\\").replace('"', '\\"')
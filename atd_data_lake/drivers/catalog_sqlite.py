@@ -0,0 +1,133 @@
+"""
+catalog_sqlite.py: Catalog functions facilitated by a local SQLite database file
+
+Kenneth Perrine
+Center for Transportation Research, The University of Texas at Austin
+"""
+import json
+import sqlite3
+import threading
+
+import arrow
+
+from atd_data_lake.util import date_util
+
+"PREFERRED_CHUNK_SIZE is the number of records that are preferred to be returned in a multi-record query."
+PREFERRED_CHUNK_SIZE = 10000
+
+class CatalogSQLite:
+    """
+    Implements catalog access functions using a SQLite database file. This is a drop-in replacement for
+    catalog_postgrest.CatalogPostgREST that works without a network, e.g. for offline reprocessing. Dates are stored
+    as given and also as integer microseconds since the epoch for correct sorting and range comparisons.
+    """
+    def __init__(self, path):
+        """
+        Opens (and creates if needed) the SQLite database at the given path.
+
+        @param path: The path to the database file, or ":memory:" for a temporary database
+        """
+        self.lock = threading.RLock()
+        self.dbConn = sqlite3.connect(path, check_same_thread=False)
+        self.dbConn.execute("PRAGMA case_sensitive_like = ON")
+        self.dbConn.execute("""CREATE TABLE IF NOT EXISTS catalog (
+  repository TEXT NOT NULL,
+  data_source TEXT NOT NULL,
+  id_base TEXT NOT NULL,
+  id_ext TEXT NOT NULL,
+  pointer TEXT NOT NULL,
+  collection_date TEXT NOT NULL,
+  collection_end TEXT,
+  processing_date TEXT,
+  metadata TEXT,
+  collection_ts INTEGER NOT NULL,
+  processing_ts INTEGER,
+  PRIMARY KEY (repository, data_source, collection_ts, id_base, id_ext))""")
+        columns = [row[1] for row in self.dbConn.execute("PRAGMA table_info(catalog)")]
+        if "processing_ts" not in columns:
+            self.dbConn.execute("ALTER TABLE catalog ADD COLUMN processing_ts INTEGER")
+        self.dbConn.execute("CREATE INDEX IF NOT EXISTS catalog_base ON catalog (repository, data_source, id_base, collection_ts)")
+        self.dbConn.execute("CREATE INDEX IF NOT EXISTS catalog_processing ON catalog (repository, data_source, processing_ts)")
+        self.dbConn.commit()
+
+    def query(self, dataSource, stage, base, ext, earlyDate=None, lateDate=None, exactEarlyDate=False, limit=None, start=None, reverse=False,
+              after=None, processedSince=None):
+        """
+        Performs a query on the given datatype, data stage, base, ext, and optional early and late dates. Returns a list
+        of dictionary objects, each a result. The parameters are the same as for CatalogPostgREST.query(). The base and
+        ext may be an exact value, a pattern containing "%%" wildcards, or a list of exact values.
+        """
+        sql = "SELECT collection_date, collection_end, processing_date, pointer, id_base, id_ext, metadata FROM catalog" \
+            + " WHERE repository = ? AND data_source = ?"
+        params = [stage, dataSource]
+        for column, value in (("id_base", base), ("id_ext", ext)):
+            if isinstance(value, (list, tuple, set, frozenset)):
+                sql += " AND %s IN (%s)" % (column, ",".join("?" * len(value)))
+                params.extend(value)
+            elif value is not None:
+                sql += (" AND %s LIKE ?" if "%%" in value else " AND %s = ?") % column
+                params.append(value.replace("%%", "%"))
+        if earlyDate is not None:
+            sql += " AND collection_ts = ?" if exactEarlyDate else " AND collection_ts >= ?"
+            params.append(toMicros(earlyDate))
+        if lateDate is not None:
+            sql += " AND collection_ts < ?"
+            params.append(toMicros(lateDate))
+        if processedSince is not None:
+            sql += " AND processing_ts >= ?"
+            params.append(toMicros(processedSince))
+        if after is not None:
+            afterTS = toMicros(after[0])
+            sql += " AND (collection_ts %s ? OR collection_ts = ? AND (id_base > ? OR id_base = ? AND id_ext > ?))" \
+                % ("<" if reverse else ">")
+            params.extend([afterTS, afterTS, after[1], after[1], after[2]])
+        sql += " ORDER BY collection_ts %s, id_base ASC, id_ext ASC" % ("DESC" if reverse else "ASC")
+        sql += " LIMIT ? OFFSET ?"
+        params.extend([-1 if limit is None else limit, 0 if start is None else start])
+        with self.lock:
+            rows = self.dbConn.execute(sql, params).fetchall()
+        return [{"collection_date": row[0],
+                 "collection_end": row[1],
+                 "processing_date": row[2],
+                 "pointer": row[3],
+                 "id_base": row[4],
+                 "id_ext": row[5],
+                 "metadata": json.loads(row[6]) if row[6] is not None else None} for row in rows]
+
+    def upsert(self, upsertDataList, commit=True):
+        """
+        Performs an upsert operation on the given list of dictionary objects (or a single dictionary object). Each
+        dictionary object shall contain "repository", "data_source", "id_base", "id_ext", "pointer", "collection_date",
+        "collection_end" (optional), "processing_date", and optionally "metadata".
+
+        @param commit: Set this to False to leave the transaction open for the caller to commit
+        """
+        if not isinstance(upsertDataList, list):
+            upsertDataList = [upsertDataList]
+        with self.lock:
+            self.dbConn.executemany("""INSERT OR REPLACE INTO catalog (repository, data_source, id_base, id_ext, pointer,
+  collection_date, collection_end, processing_date, metadata, collection_ts, processing_ts) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                [(element["repository"], element["data_source"], element["id_base"], element["id_ext"], element["pointer"],
+                  str(element["collection_date"]),
+                  str(element["collection_end"]) if element.get("collection_end") else None,
+                  str(element["processing_date"]) if element.get("processing_date") else None,
+                  json.dumps(element["metadata"]) if element.get("metadata") is not None else None,
+                  toMicros(element["collection_date"]),
+                  toMicros(element["processing_date"]) if element.get("processing_date") else None) for element in upsertDataList])
+            if commit:
+                self.dbConn.commit()
+
+    @staticmethod
+    def getPreferredChunk():
+        """
+        Returns the preferred chunk size that catalog.Catalog.query() should use in requests.
+        """
+        return PREFERRED_CHUNK_SIZE
+
+def toMicros(dateValue):
+    """
+    Converts the given date string or datetime into an integer number of microseconds since the epoch.
+    """
+    if isinstance(dateValue, str):
+        dateValue = arrow.get(dateValue).datetime
+    return date_util.toEpochMicros(dateValue)
@@ -73,6 +73,18 @@ class WT_MSSQL_DB:
             ret[date_util.localize(datetime.datetime.strptime(row[0], "%Y-%m-%d"))] = int(row[1])
         return ret
 
+    def probe(self, earlyDate, lateDate):
+        """
+        Checks for the presence of any record on or after earlyDate and before lateDate. This only needs to find the
+        first matching row, rather than aggregate over the whole table as query() does.
+        """
+        cursor = self.conn.cursor()
+        sql = "SELECT TOP 1 1 FROM KITSDB.KITS.SYSDETHISTORYRM"
+        sql += self._buildDatePart(earlyDate, lateDate, includeWhere=True)
+        sql += ";"
+        cursor.execute(sql)
+        return cursor.fetchone() is not None
+
     def retrieve(self, earlyDate=None, lateDate=None):
         """
         Returns Wavetronix records between the given dates. Returns dictionary of days with list of records as values.
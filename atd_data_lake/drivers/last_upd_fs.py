@@ -4,6 +4,7 @@ last_upd_fs: Implements the last-update functionality for a filesystem
 @author Kenneth Perrine
 """
 from collections.abc import Iterable
+import os
 
 from atd_data_lake.support.last_update import LastUpdProv
 from atd_data_lake.util import date_dirs, date_util
@@ -80,3 +81,15 @@ class LastUpdFileProv(LastUpdProv):
                                            dateEnd=(date + self.impliedDuration) if self.impliedDuration else None,
                                            payload=self.dateDirs[index],
                                            label=myFile)
+
+    def getSizes(self, lastUpdItems):
+        """
+        Returns a list of the sizes in bytes of the files behind the given _LastUpdateItem objects.
+        """
+        ret = []
+        for item in lastUpdItems:
+            try:
+                ret.append(os.path.getsize(item.provItem.label))
+            except OSError:
+                ret.append(None)
+        return ret
@@ -5,15 +5,14 @@ perfmet_postgrest.py: Database operations for performance metrics implemented in
 """
 import datetime
 
-from pypgrest import Postgrest
-
+from atd_data_lake.drivers.postgrest_pool import PostgrestPooled
 from atd_data_lake.util import date_util
 
 class PerfMetDB:
     """
     Represents a connection to the PostgREST instance of the performance metrics tables.
     """
-    def __init__(self, accessPointJob, accessPointObs, apiKey, needsObs=False):
+    def __init__(self, accessPointJob, accessPointObs, apiKey, needsObs=False, jobMetadata=False):
         """
         Initializes the connection to the PostgREST instance.
         
@@ -21,11 +20,13 @@ class PerfMetDB:
         @param accessPointObs: the PostgREST "etl_perfmet_obs" table endpoint
         @param apiKey: the PostgREST API key needed to write to the endpoints
         @param needsObs: set this to True to enable the writing of observations.
+        @param jobMetadata: set this to True to write phase timings to the "metadata" column of the job table.
         """
-        self.jobDB = Postgrest(accessPointJob, auth=apiKey)
+        self.jobDB = PostgrestPooled(accessPointJob, auth=apiKey)
         self.obsDB = None
+        self.jobMetadata = jobMetadata
         if needsObs:
-            self.obsDB = Postgrest(accessPointObs, auth=apiKey)
+            self.obsDB = PostgrestPooled(accessPointObs, auth=apiKey)
             
     def writeJob(self, perfMet):
         """
@@ -38,6 +39,8 @@ class PerfMetDB:
                     "processing_date": str(perfMet.processingTime),
                     "collection_start": str(date_util.localize(perfMet.collectTimeStart)) if perfMet.collectTimeStart else None,
                     "collection_end": str(date_util.localize(perfMet.collectTimeEnd)) if perfMet.collectTimeEnd else None}
+        if self.jobMetadata:
+            metadata["metadata"] = {"spans": perfMet.spans}
         self.jobDB.upsert(metadata)
 
     def readAllJobs(self, timestampIn):
@@ -65,14 +68,18 @@ class PerfMetDB:
             ret = None
         return ret
     
-    def writeObs(self, perfMet):
+    def writeObs(self, perfMet, observations=None):
         """
         Writes observations to the observations log.
+        
+        @param observations: A dictionary of observations to write in place of perfMet.observations
         """
         metadata = []
-        if not perfMet.observations:
+        if observations is None:
+            observations = perfMet.observations
+        if not observations:
             return
-        for identifier, obs in perfMet.observations.items():
+        for identifier, obs in observations.items():
             minTimestamp = obs.minTimestamp
             if minTimestamp:
                 if isinstance(minTimestamp, datetime.datetime):
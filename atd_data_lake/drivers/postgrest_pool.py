@@ -0,0 +1,70 @@
+"""
+postgrest_pool.py: PostgREST access through a shared, pooled set of keep-alive HTTP connections
+
+@author Kenneth Perrine
+"""
+import requests
+from requests.adapters import HTTPAdapter
+
+"DEFAULT_POOL_SIZE is the default number of connections that are kept alive for each host."
+DEFAULT_POOL_SIZE = 10
+
+"TIMEOUT is the number of seconds that a request can wait for connecting or for a response."
+TIMEOUT = 120
+
+_HTTP_SESSION = None
+
+def configPool(poolSize=DEFAULT_POOL_SIZE):
+    """
+    Sets up the shared HTTP session that all PostgREST tables use.
+
+    @param poolSize: The number of connections to keep alive per host; set to at least the number of concurrent workers
+    """
+    global _HTTP_SESSION
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip",
+                            "Connection": "keep-alive"})
+    _HTTP_SESSION = session
+
+def isPoolConfigured():
+    return not _HTTP_SESSION is None
+
+class PostgrestPooled:
+    """
+    Accesses a single PostgREST table endpoint using the shared connection pool. This provides the same select() and
+    upsert() calls that had been used from the pypgrest package.
+    """
+    def __init__(self, accessPoint, auth=None):
+        """
+        Initializes the object. The shared connection pool is set up with defaults if configPool() hadn't been called.
+
+        @param accessPoint: The URL of the PostgREST table endpoint
+        @param auth: The API key needed to write to the endpoint
+        """
+        if not isPoolConfigured():
+            configPool()
+        self.accessPoint = accessPoint
+        self.headers = {"Content-Type": "application/json"}
+        if auth:
+            self.headers["Authorization"] = "Bearer %s" % auth
+
+    def select(self, params=None):
+        """
+        Performs a query using the given PostgREST parameters and returns the list of resulting records.
+        """
+        response = _HTTP_SESSION.get(self.accessPoint, params=params, headers=self.headers, timeout=TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    def upsert(self, data):
+        """
+        Inserts the given record or list of records, updating those that already exist.
+        """
+        headers = dict(self.headers)
+        headers["Prefer"] = "return=minimal,resolution=merge-duplicates"
+        response = _HTTP_SESSION.post(self.accessPoint, json=data, headers=headers, timeout=TIMEOUT)
+        response.raise_for_status()
@@ -4,13 +4,25 @@ storage_s3.py: Storage functions facilitated by Amazon AWS S3
 Kenneth Perrine
 Center for Transportation Research, The University of Texas at Austin
 """
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import io
 import os
+import threading
+
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 import arrow
 
 from atd_data_lake.support import storage
 
 _AWS_SESSION = None
+_AWS_SESSION_LOCK = threading.Lock()
+_TRANSFER_CONFIG = None
+_CLIENT_CONFIG = None
+
+"S3_MIN_PART_SIZE is the smallest size that S3 allows for each part of a multipart upload other than the last."
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
 
 def configAWS_S3(awsKey, awsSecretKey):
     global _AWS_SESSION
@@ -20,6 +32,22 @@ def configAWS_S3(awsKey, awsSecretKey):
 def isAWS_S3_Configured():
     return not _AWS_SESSION is None
 
+def configTransfer(multipartThreshold, partSize, concurrency, partAttempts):
+    """
+    Sets how objects are moved to and from S3. Objects at least multipartThreshold bytes in size are uploaded in
+    parts and downloaded in byte ranges of partSize bytes, with up to the given number of parts moving at once. Each
+    part that fails is retried on its own, up to the given number of attempts. Call this before the first S3 resource
+    is used.
+    """
+    global _TRANSFER_CONFIG, _CLIENT_CONFIG
+    
+    _TRANSFER_CONFIG = TransferConfig(multipart_threshold=multipartThreshold, multipart_chunksize=partSize,
+                                      max_concurrency=concurrency, num_download_attempts=partAttempts,
+                                      use_threads=concurrency > 1)
+    # Each part request is retried by botocore; the connection pool must also have room for all parts at once:
+    _CLIENT_CONFIG = Config(retries={"max_attempts": partAttempts, "mode": "standard"},
+                            max_pool_connections=max(10, concurrency))
+
 class StorageS3(storage.StorageImpl):
     """
     Implements storage access functions using AWS S3.
@@ -30,8 +58,18 @@ class StorageS3(storage.StorageImpl):
         
         @param repository: The name of the "bucket" or repository that will be accessed
         """
-        self.S3 = _AWS_SESSION.resource('s3')
+        self.threadLocal = threading.local()
         self.repository = repository
+    
+    @property
+    def S3(self):
+        """
+        Returns the S3 resource for the current thread, as boto3 resources aren't safe to share between threads.
+        """
+        if not hasattr(self.threadLocal, "S3"):
+            with _AWS_SESSION_LOCK:
+                self.threadLocal.S3 = _AWS_SESSION.resource('s3', config=_CLIENT_CONFIG)
+        return self.threadLocal.S3
         
     def makePath(self, dataSource, collectionDate, filename=None):
         """
@@ -64,26 +102,173 @@ class StorageS3(storage.StorageImpl):
         """
         if deriveFilename:
             destPath = os.path.join(destPath, self.extractFilename(path))
-        self.S3.Bucket(self.repository).download_file(path, destPath)
+        self.S3.Bucket(self.repository).download_file(path, destPath, Config=_TRANSFER_CONFIG)
         return destPath
         
     def retrieveBufferPath(self, path):
         """
         retrieveBufferPath retrieves a resource at the given storage platform-specific path and provides it as a buffer.
         """
+        buffer = io.BytesIO()
+        self.S3.Bucket(self.repository).download_fileobj(path, buffer, Config=_TRANSFER_CONFIG)
+        return buffer.getvalue()
+        
+    def openReadStream(self, path):
+        """
+        Returns a binary stream for reading the object at the given S3 path as it is downloaded.
+        """
+        return self.S3.Object(self.repository, path).get()["Body"]
+        
+    def getSizes(self, paths):
+        """
+        Returns a dictionary of the given S3 paths to their sizes in bytes. One listing is made for each distinct
+        prefix (i.e. each date directory), rather than one request for each object.
+        """
+        prefixes = {}
+        for path in paths:
+            prefixes.setdefault(path.rsplit("/", 1)[0] + "/" if "/" in path else "", set()).add(path)
+        ret = {}
+        bucket = self.S3.Bucket(self.repository)
+        for prefix, prefixPaths in prefixes.items():
+            for obj in bucket.objects.filter(Prefix=prefix):
+                if obj.key in prefixPaths:
+                    ret[obj.key] = obj.size
+        return ret
+        
+    def getValidator(self, path):
+        """
+        Returns a tuple of the ETag and size of the object at the given S3 path, found with a HEAD request.
+        """
         obj = self.S3.Object(self.repository, path)
-        return obj.get()['Body'].read()
+        obj.load()
+        return obj.e_tag, obj.content_length
         
-    def writeFile(self, sourceFile, path):
+    def writeFile(self, sourceFile, path, contentType=None, contentEncoding=None):
         """
         writeFile writes sourceFile to the target fully specified S3 path.
+        
+        @param contentType: The MIME type of the contents, if known, which is set as the object's Content-Type
+        @param contentEncoding: The compression of the contents, if any, which is set as the object's Content-Encoding
         """
-        with open(sourceFile, 'rb') as fileObj:
-            self.writeBuffer(fileObj, path)
+        self.S3.Bucket(self.repository).upload_file(sourceFile, path, ExtraArgs=_makeExtraArgs(contentType, contentEncoding),
+                                                    Config=_TRANSFER_CONFIG)
         
-    def writeBuffer(self, sourceBuffer, path):
+    def writeBuffer(self, sourceBuffer, path, contentType=None, contentEncoding=None):
         """
         writeBuffer writes the contents of the buffer into the target fully specified S3 path.
+        
+        @param contentType: The MIME type of the contents, if known, which is set as the object's Content-Type
+        @param contentEncoding: The compression of the contents, if any, which is set as the object's Content-Encoding
         """
-        obj = self.S3.Object(self.repository, path)
-        obj.put(Body=sourceBuffer)        
+        if isinstance(sourceBuffer, (bytes, bytearray)):
+            sourceBuffer = io.BytesIO(sourceBuffer)
+        self.S3.Bucket(self.repository).upload_fileobj(sourceBuffer, path, ExtraArgs=_makeExtraArgs(contentType, contentEncoding),
+                                                       Config=_TRANSFER_CONFIG)
+        
+    def openWriteStream(self, path, contentType=None, contentEncoding=None):
+        """
+        Returns a writable stream for the target fully specified S3 path, for use in a "with" statement. Data are sent
+        in parts of a multipart upload as they are written.
+        """
+        return S3WriteStream(self.S3.meta.client, self.repository, path, _TRANSFER_CONFIG or TransferConfig(),
+                             extraArgs=_makeExtraArgs(contentType, contentEncoding))
+
+def _makeExtraArgs(contentType, contentEncoding):
+    """
+    Returns the extra arguments for an upload that label the object's Content-Type and Content-Encoding, or None if
+    neither is given.
+    """
+    ret = {}
+    if contentType:
+        ret["ContentType"] = contentType
+    if contentEncoding:
+        ret["ContentEncoding"] = contentEncoding
+    return ret or None
+
+class S3WriteStream:
+    """
+    Sends the bytes that are written to an S3 object as parts of a multipart upload while writing goes on, keeping
+    only a few parts in memory at a time. Objects that end up smaller than one part are sent with a single request.
+    The upload is completed with close(), or is cancelled with abort().
+    """
+    def __init__(self, client, bucket, key, transferConfig, extraArgs=None):
+        """
+        @param client: A boto3 S3 client, which may be shared among threads
+        @param transferConfig: A boto3 TransferConfig that supplies the part size and concurrency
+        @param extraArgs: A dictionary of additional arguments for creating the object, such as "ContentEncoding"
+        """
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.extraArgs = extraArgs or {}
+        self.partSize = max(transferConfig.multipart_chunksize, S3_MIN_PART_SIZE)
+        self.concurrency = max(transferConfig.max_concurrency, 1)
+        self.buffer = bytearray()
+        self.uploadID = None
+        self.executor = None
+        self.partFutures = []
+        
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.partSize:
+            self._sendPart(bytes(self.buffer[:self.partSize]))
+            del self.buffer[:self.partSize]
+            
+    def _sendPart(self, data):
+        """
+        Starts sending the next part, first waiting if as many parts as allowed are already being sent.
+        """
+        if not self.uploadID:
+            self.uploadID = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key, **self.extraArgs)["UploadId"]
+            self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        pending = [future for future in self.partFutures if not future.done()]
+        if len(pending) >= self.concurrency:
+            wait(pending, return_when=FIRST_COMPLETED)
+        for future in self.partFutures:
+            if future.done():
+                future.result() # Stops early if a part has failed.
+        # Each part request is retried by botocore according to the client configuration:
+        self.partFutures.append(self.executor.submit(self.client.upload_part, Bucket=self.bucket, Key=self.key,
+            UploadId=self.uploadID, PartNumber=len(self.partFutures) + 1, Body=data))
+        
+    def close(self):
+        """
+        Sends what remains and completes the upload.
+        """
+        if not self.uploadID:
+            self.client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer), **self.extraArgs)
+            self.buffer = bytearray()
+            return
+        try:
+            if self.buffer:
+                self._sendPart(bytes(self.buffer))
+                self.buffer = bytearray()
+            parts = [{"ETag": future.result()["ETag"], "PartNumber": index + 1} for index, future in enumerate(self.partFutures)]
+            self.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.uploadID,
+                                                  MultipartUpload={"Parts": parts})
+        except Exception:
+            self.abort()
+            raise
+        self.executor.shutdown()
+        
+    def abort(self):
+        """
+        Cancels the upload so that S3 discards any parts that had been sent.
+        """
+        self.buffer = bytearray()
+        if self.uploadID:
+            for future in self.partFutures:
+                future.cancel()
+            self.executor.shutdown()
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.uploadID)
+            self.uploadID = None
+            
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, excType, excValue, tb):
+        if excType:
+            self.abort()
+        else:
+            self.close()
+        return False
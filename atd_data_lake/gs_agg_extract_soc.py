@@ -3,12 +3,12 @@ Publish GRIDSMART Aggregated "Ready" Data Lake data
 
 @author Kenneth Perrine, Nadia Florez
 """
-import hashlib
+import hashlib, os
 
 import arrow
 
 import _setpath
-from atd_data_lake.support import etl_app, last_update
+from atd_data_lake.support import etl_app, last_update, json_stream
 from atd_data_lake import config
 
 # This sets up application information:
@@ -20,6 +20,9 @@ class GSAggPublishApp(etl_app.ETLApp):
     """
     Application functions and special behavior around GRIDSMART exporting to Socrata.
     """
+    # The publisher is shared between items.
+    parallelItems = False
+    
     def __init__(self, args):
         """
         Initializes application-specific variables
@@ -61,7 +64,18 @@ class GSAggPublishApp(etl_app.ETLApp):
         """
         # Read in the file and call the transformation code.
         print("%s: %s -> %s" % (item.label, self.storageSrc.repository, self.publisher.connector.getIdentifier()))
-        data = self.storageSrc.retrieveJSON(item.label)
+        # The site and device come after the data rows, so the file is read through twice rather than being held in memory:
+        filePath = self.storageSrc.retrieveFilePath(item.label)
+        try:
+            return self._publishFile(item, filePath)
+        finally:
+            os.remove(filePath)
+
+    def _publishFile(self, item, filePath):
+        """
+        Publishes the contents of the given retrieved file and records it in the catalog.
+        """
+        data = json_stream.readSections(filePath, ["site", "device"])
         device = data["device"] if "device" in data else None
         
         # Contingency for bad device info:
@@ -74,7 +88,7 @@ class GSAggPublishApp(etl_app.ETLApp):
 
         # Assemble JSON for the publisher:
         errDup = {}
-        for line in data["data"]:
+        for line in json_stream.iterRows(filePath):
             approach = line["zone_approach"]
             if approach == "Southbound":
                 approach = "SOUTHBOUND"
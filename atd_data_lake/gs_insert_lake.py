@@ -19,6 +19,9 @@ class GSInsertLakeApp(etl_app.ETLApp):
     """
     Application functions and special behavior around GRIDSMART ingestion.
     """
+    # Site files and unit data are written by whichever item comes first.
+    parallelItems = False
+    
     def __init__(self, args):
         """
         Initializes application-specific variables
@@ -54,8 +57,7 @@ class GSInsertLakeApp(etl_app.ETLApp):
         @return count: A general number of records processed
         """
         # First, get the unit data for GRIDSMART:
-        unitDataProv = config.createUnitDataAccessor(self.dataSource)
-        self.unitData = unitDataProv.retrieve()
+        self.unitData = self.retrieveUnitData()
         deviceLogreaders = gs_support.getDevicesLogreaders(self.unitData, self.deviceFilter)
                 
         # Configure the source and target repositories and start the compare loop:
@@ -3,7 +3,7 @@ JSON standardization for GRIDSMART
 
 @author Kenneth Perrine, Nadia Florez
 """
-import os, datetime, json
+import os, datetime
 
 import pandas as pd
 import pytz
@@ -23,6 +23,9 @@ class GSJSONStandardApp(etl_app.ETLApp):
     """
     Application functions and special behavior around GRIDSMART JSON canonicalization.
     """
+    # Site files, unit data and sensor observations are tracked from one item to the next.
+    parallelItems = False
+    
     def __init__(self, args):
         """
         Initializes application-specific variables
@@ -45,14 +48,15 @@ class GSJSONStandardApp(etl_app.ETLApp):
         @return count: A general number of records processed
         """
         # First, get the unit data for GRIDSMART:
-        self.unitDataProv = config.createUnitDataAccessor(self.storageSrc).prepare(self.startDate, self.endDate)
+        self.unitDataProv = self.retrieveUnitDataProv(self.storageSrc)
         
         # Prepare to get site files:
         self.siteFileCatElems = self.storageSrc.catalog.getSearchableQueryDict(self.storageSrc.repository,
                                                                                base=None, 
                                                                                ext="site.json",
                                                                                earlyDate=self.startDate,
-                                                                               lateDate=self.endDate)
+                                                                               lateDate=self.endDate,
+                                                                               includePrior=True)
                 
         # Configure the source and target repositories and start the compare loop:
         count = self.doCompareLoop(last_update.LastUpdStorageCatProv(self.storageSrc, extFilter="zip"),
@@ -80,7 +84,7 @@ class GSJSONStandardApp(etl_app.ETLApp):
             siteFile = self.siteFileCache[item.identifier.base]
         else:
             # Get site file from repository if needed:
-            siteFile = json.loads(self.storageSrc.retrieveBuffer(siteFileCatElem["pointer"]))
+            siteFile = self.storageSrc.retrieveJSON(siteFileCatElem["pointer"], cache=True)
             self.siteFileCache[item.identifier.base] = siteFile
         
         # Obtain unit data, and write it to the target repository if it's new:
@@ -211,85 +215,7 @@ class GSJSONStandard:
             jsonData['header']['version'] = self.apiVersion
             jsonData['header']['guid'] = guid
 
-            data = pd.read_csv(csvPath, header=None, names=self.columns)
-            jsonData['data'] = data.apply(lambda x: x.to_dict(), axis=1).tolist()
-
-            # Fix the time representation. First, find the time delta:
-            errs = {}
-            newData = []
-            try:
-                hostTimeUTC = self._getTime(self.siteFile["datetime"]["HostTimeUTC"])
-                deviceTime = self._getTime(self.siteFile["datetime"]["DateTime"], self.siteFile["datetime"]["TimeZoneId"].split()[0])
-                timeDelta = hostTimeUTC - deviceTime
-                
-                # At this point, collect an indication of whether this file accounts for some of the previous day, or some of the
-                # next day.
-                collDatetime = self.item.identifier.date.replace(hour=0, minute=0, second=0, microsecond=0)
-                timestamp = None
-                if self.apiVersion == 8 and jsonData['data']:
-                    timestamp = datetime.datetime.strptime(collDateStr.split()[0] + " 000000", "%Y-%m-%d %H%M%S")
-                    timestamp -= datetime.timedelta(minutes=jsonData['data'][0]['utc_offset'])
-                    timestamp = pytz.utc.localize(timestamp)
-                    timestamp = date_util.localize(timestamp + timeDelta)
-                elif self.apiVersion == 7:
-                    print("WARNING: 'timestamp_adj' processing not provided for API v7!")
-                    # TODO: Figure out the date parsing needed for this.
-                elif self.apiVersion == 4:
-                    timestamp = datetime.datetime.strptime(collDateStr.split()[0] + " 000000", "%Y-%m-%d %H%M%S")
-                    timestamp = pytz.utc.localize(timestamp)
-                    timestamp = date_util.localize(timestamp + timeDelta)
-                if timestamp:
-                    if timestamp < collDatetime:
-                        jsonData['header']['day_covered'] = -1
-                    elif timestamp == collDatetime:
-                        jsonData['header']['day_covered'] = 0
-                    else:
-                        jsonData['header']['day_covered'] = 1
-                
-                # Add in "timestamp_adj" for each data item:
-                for item in jsonData['data']:
-                    try:
-                        if self.apiVersion == 8:
-                            # TODO: The UTC Offset doesn't seem to reflect DST. Should we ignore it and blindly localize instead?
-                            #       We can figure this out by seeing what the latest count is on a live download of the current day.
-                            timestamp = datetime.datetime.strptime(collDateStr.split()[0] + " " \
-                                + ("%06d" % int(float(item['timestamp']))) + "." + str(round((item['timestamp'] % 1) * 10) * 100000),
-                                "%Y-%m-%d %H%M%S.%f")
-                            timestamp -= datetime.timedelta(minutes=item['utc_offset'])
-                            timestamp = pytz.utc.localize(timestamp)
-                            item['timestamp_adj'] = str(date_util.localize(timestamp + timeDelta))
-                        elif self.apiVersion == 7:
-                            print("WARNING: 'timestamp_adj' processing not provided for API v7!")
-                            # TODO: Figure out the date parsing needed for this.
-                        elif self.apiVersion == 4:
-                            timestamp = datetime.datetime.strptime(item['timestamp'], "%Y%m%dT%H%M%S" + (".%f" if "." in item['timestamp'] else ""))
-                            timestamp = pytz.utc.localize(timestamp)
-                            item['timestamp_adj'] = str(date_util.localize(timestamp + timeDelta))
-                            
-                            item['count_version'] = int(item['count_version'])
-                        if timestamp:
-                            # Performance metrics:
-                            if not self.perfWork[1]:
-                                self.perfWork = [0, timestamp, timestamp]
-                            self.perfWork[0] += 1
-                            if timestamp < self.perfWork[1]:
-                                self.perfWork[1] = timestamp
-                            if timestamp > self.perfWork[2]:
-                                self.perfWork[2] = timestamp
-                        newData.append(item)
-                    except ValueError as exc:
-                        err = "WARNING: Value parsing error: " + str(exc)
-                        if err not in errs:
-                            errs[err] = 0
-                        errs[err] += 1
-                jsonData['data'] = newData
-                for err in errs:
-                    print(err + " (" + str(errs[err]) + ")")
-            except KeyError:
-                print("WARNING: Time representation processing has malfunctioned. Correct time key may not be present in site file.")
-            except ValueError as exc:
-                print("WARNING: Time representation processing has malfunctioned. Value parsing error:")
-                print(exc)
+            self._standardizeData(csvPath, jsonData, collDateStr)
             
             # Write to storage object:
             catalogElement = self.storageTgt.createCatalogElement(self.item.identifier.base, guid + ".json", 
@@ -300,6 +226,92 @@ class GSJSONStandard:
             print("JSON standardization saved as {}".format(targetFilename))
             print("File {} out of {} done!".format(i, n))
             
+    @perfmet.timed("transform")
+    def _standardizeData(self, csvPath, jsonData, collDateStr):
+        """
+        Reads the given unzipped CSV file into jsonData, adding "timestamp_adj" to each row and "day_covered" to the
+        header.
+        """
+        data = pd.read_csv(csvPath, header=None, names=self.columns)
+        jsonData['data'] = data.apply(lambda x: x.to_dict(), axis=1).tolist()
+
+        # Fix the time representation. First, find the time delta:
+        errs = {}
+        newData = []
+        try:
+            hostTimeUTC = self._getTime(self.siteFile["datetime"]["HostTimeUTC"])
+            deviceTime = self._getTime(self.siteFile["datetime"]["DateTime"], self.siteFile["datetime"]["TimeZoneId"].split()[0])
+            timeDelta = hostTimeUTC - deviceTime
+            
+            # At this point, collect an indication of whether this file accounts for some of the previous day, or some of the
+            # next day.
+            collDatetime = self.item.identifier.date.replace(hour=0, minute=0, second=0, microsecond=0)
+            timestamp = None
+            if self.apiVersion == 8 and jsonData['data']:
+                timestamp = datetime.datetime.strptime(collDateStr.split()[0] + " 000000", "%Y-%m-%d %H%M%S")
+                timestamp -= datetime.timedelta(minutes=jsonData['data'][0]['utc_offset'])
+                timestamp = pytz.utc.localize(timestamp)
+                timestamp = date_util.localize(timestamp + timeDelta)
+            elif self.apiVersion == 7:
+                print("WARNING: 'timestamp_adj' processing not provided for API v7!")
+                # TODO: Figure out the date parsing needed for this.
+            elif self.apiVersion == 4:
+                timestamp = datetime.datetime.strptime(collDateStr.split()[0] + " 000000", "%Y-%m-%d %H%M%S")
+                timestamp = pytz.utc.localize(timestamp)
+                timestamp = date_util.localize(timestamp + timeDelta)
+            if timestamp:
+                if timestamp < collDatetime:
+                    jsonData['header']['day_covered'] = -1
+                elif timestamp == collDatetime:
+                    jsonData['header']['day_covered'] = 0
+                else:
+                    jsonData['header']['day_covered'] = 1
+            
+            # Add in "timestamp_adj" for each data item:
+            for item in jsonData['data']:
+                try:
+                    if self.apiVersion == 8:
+                        # TODO: The UTC Offset doesn't seem to reflect DST. Should we ignore it and blindly localize instead?
+                        #       We can figure this out by seeing what the latest count is on a live download of the current day.
+                        timestamp = datetime.datetime.strptime(collDateStr.split()[0] + " " \
+                            + ("%06d" % int(float(item['timestamp']))) + "." + str(round((item['timestamp'] % 1) * 10) * 100000),
+                            "%Y-%m-%d %H%M%S.%f")
+                        timestamp -= datetime.timedelta(minutes=item['utc_offset'])
+                        timestamp = pytz.utc.localize(timestamp)
+                        item['timestamp_adj'] = str(date_util.localize(timestamp + timeDelta))
+                    elif self.apiVersion == 7:
+                        print("WARNING: 'timestamp_adj' processing not provided for API v7!")
+                        # TODO: Figure out the date parsing needed for this.
+                    elif self.apiVersion == 4:
+                        timestamp = datetime.datetime.strptime(item['timestamp'], "%Y%m%dT%H%M%S" + (".%f" if "." in item['timestamp'] else ""))
+                        timestamp = pytz.utc.localize(timestamp)
+                        item['timestamp_adj'] = str(date_util.localize(timestamp + timeDelta))
+                        
+                        item['count_version'] = int(item['count_version'])
+                    if timestamp:
+                        # Performance metrics:
+                        if not self.perfWork[1]:
+                            self.perfWork = [0, timestamp, timestamp]
+                        self.perfWork[0] += 1
+                        if timestamp < self.perfWork[1]:
+                            self.perfWork[1] = timestamp
+                        if timestamp > self.perfWork[2]:
+                            self.perfWork[2] = timestamp
+                    newData.append(item)
+                except ValueError as exc:
+                    err = "WARNING: Value parsing error: " + str(exc)
+                    if err not in errs:
+                        errs[err] = 0
+                    errs[err] += 1
+            jsonData['data'] = newData
+            for err in errs:
+                print(err + " (" + str(errs[err]) + ")")
+        except KeyError:
+            print("WARNING: Time representation processing has malfunctioned. Correct time key may not be present in site file.")
+        except ValueError as exc:
+            print("WARNING: Time representation processing has malfunctioned. Value parsing error:")
+            print(exc)
+
 def main(args=None):
     """
     Main entry point. Allows for dictionary to bypass default command-line processing.
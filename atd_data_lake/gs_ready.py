@@ -3,12 +3,12 @@ ATD Data Lake 'ready' bucket for GRIDSMART
 
 @author Kenneth Perrine, Nadia Florez
 """
-import datetime, collections, difflib, json, traceback
+import datetime, collections, difflib, traceback
 
 import arrow
 
 import _setpath
-from atd_data_lake.support import etl_app, last_update
+from atd_data_lake.support import etl_app, last_update, perfmet
 from atd_data_lake import config
 from atd_data_lake.config import config_app
 from atd_data_lake.util import gps_h, date_util
@@ -28,6 +28,10 @@ class GSReadyApp(etl_app.ETLApp):
     """
     Application functions and special behavior around GRIDSMART ingestion.
     """
+    # Items are batched up by day and processed when the day changes.
+    parallelItems = False
+    resumableItems = False
+    
     def __init__(self, args):
         """
         Initializes application-specific variables
@@ -59,14 +63,15 @@ class GSReadyApp(etl_app.ETLApp):
         @return count: A general number of records processed
         """
         # First, get the unit data for GRIDSMART:
-        self.unitDataProv = config.createUnitDataAccessor(self.storageSrc).prepare(self.startDate, self.endDate)
+        self.unitDataProv = self.retrieveUnitDataProv(self.storageSrc)
 
         # Prepare to get site files:
         self.siteFileCatElems = self.storageSrc.catalog.getSearchableQueryDict(self.storageSrc.repository,
                                                                                base=None,
                                                                                ext="site.json",
                                                                                earlyDate=self.startDate,
-                                                                               lateDate=self.endDate)
+                                                                               lateDate=self.endDate,
+                                                                               includePrior=True)
         
         # Configure the source and target repositories and start the compare loop:
         self.bases.clear()
@@ -75,7 +80,8 @@ class GSReadyApp(etl_app.ETLApp):
                                    last_update.LastUpdStorageCatProv(self.storageTgt),
                                    baseExtKey=False)
         # Process the last day's worth of records:
-        count += self._processDay(self.curDate)
+        if self.curDate:
+            count += self._processDay(self.curDate)
         
         print("Records processed: %d" % count)
         return count    
@@ -116,6 +122,12 @@ class GSReadyApp(etl_app.ETLApp):
         
         # Iterate through each intersection:
         sortedBases = sorted(self.bases)
+        
+        # Look up the catalog entries for all GUID files of all intersections for this day and the adjacent days at once:
+        if sortedBases:
+            self.storageSrc.catalog.prefetch(self.storageSrc.repository, sortedBases, None,
+                                             date_util.localize(date.replace(tzinfo=None) - datetime.timedelta(days=1)),
+                                             date_util.localize(date.replace(tzinfo=None) + datetime.timedelta(days=1)))
         for base in sortedBases:
             print("== " + base + ": " + date.strftime("%Y-%m-%d") + " ==")
             
@@ -128,7 +140,7 @@ class GSReadyApp(etl_app.ETLApp):
                 siteFile = self.siteFileCache[base]
             else:
                 # Get site file from repository if needed:
-                siteFile = json.loads(self.storageSrc.retrieveBuffer(siteFileCatElem["pointer"]))
+                siteFile = self.storageSrc.retrieveJSON(siteFileCatElem["pointer"], cache=True)
                 self.siteFileCache[base] = siteFile
             
             # Step 2: Resolve the base to the units file:
@@ -296,15 +308,13 @@ class GSReadyApp(etl_app.ETLApp):
                     traceback.print_exc()
                     continue
                 
-                newFileContents = {"header": header,
-                                   "counts": countsReceiver,
-                                   "site": siteFile,
-                                   "device": matchedDevice if matchedDevice else []}
-                
                 # TODO: Continue to see out how to positively resolve NORTHBOUND, EASTBOUND, etc. to street geometry.
                 catalogElem = self.storageTgt.createCatalogElement(base, "counts.json", date, self.processingDate)
                 print("INFO: Writing: " + catalogElem["pointer"])
-                self.storageTgt.writeJSON(newFileContents, catalogElem, cacheCatalogFlag=False)
+                self.storageTgt.writeJSONStream(header, countsReceiver, catalogElem,
+                                                extraSections={"site": siteFile,
+                                                               "device": matchedDevice if matchedDevice else []},
+                                                rowSection="counts", cacheCatalogFlag=False)
                 # We turned off cacheCatalogFlag because we're writing many files, and would have to specially handle the last day.
 
                 # Performance metrics:
@@ -319,7 +329,8 @@ class GSReadyApp(etl_app.ETLApp):
 def getCountsFile(date, base, guid, storage):
     """
     Using a base (street intersection name), attempts to retrieve from storage the file that corresponds with
-    the given GUID for the given date. Returns path to the file, or None if it doesn't exist.   
+    the given GUID for the given date. Returns path to the file, or None if it doesn't exist. The catalog lookup is
+    answered from memory if Catalog.prefetch() had been called for the day.
     """
     catalogElement = storage.catalog.querySingle(storage.repository, base, guid + ".json", date)
     if not catalogElement:
@@ -327,6 +338,7 @@ def getCountsFile(date, base, guid, storage):
     print("INFO: Retrieving: " + catalogElement["pointer"])
     return storage.retrieveJSON(catalogElement["pointer"])
 
+@perfmet.timed("transform")
 def fillDayRecords(ourDate, countsFileData, ident, receiver):
     "Caution: this mutates countsFileData."
     
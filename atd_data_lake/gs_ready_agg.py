@@ -8,7 +8,7 @@ import numpy as np
 import arrow
 
 import _setpath
-from atd_data_lake.support import etl_app, last_update
+from atd_data_lake.support import etl_app, last_update, perfmet
 from atd_data_lake.util import date_util
 
 APP_DESCRIPTION = etl_app.AppDescription(
@@ -65,6 +65,36 @@ class GSReadyAggApp(etl_app.ETLApp):
                                       "turn_type": zoneMask["Vehicle"]["TurnType"],
                                       "zone": zoneMask["Vehicle"]["Id"]})
         
+        summarized = self._aggregateCounts(data, movements)
+        
+        # Update the header
+        header["processing_date"] = str(date_util.localize(arrow.now().datetime))
+        header["agg_interval_sec"] = self.args.agg * 60
+        
+        # Assemble together the aggregation file:
+        newFileContents = {"header": header,
+                           "data": summarized.apply(lambda x: x.to_dict(), axis=1).tolist(),
+                           "site": data["site"],
+                           "device": data["device"]}
+        
+        # Write the aggregation:
+        catalogElement = self.storageTgt.createCatalogElement(item.identifier.base, "agg%d.json" % self.args.agg,
+                                                              item.identifier.date, self.processingDate)
+        self.storageTgt.writeJSON(newFileContents, catalogElement)
+            
+        # Performance metrics logging:
+        self.perfmet.recordCollect(item.identifier.date, representsDay=True)
+        
+        return 1
+
+    @perfmet.timed("transform")
+    def _aggregateCounts(self, data, movements):
+        """
+        Aggregates the counts from the given "Ready" file by interval, approach, movement, and vehicle type.
+        
+        @param movements: The list of zone approaches and turn types from the site file
+        @return A DataFrame of the summarized counts
+        """
         # Process the counts:
         countData = pd.DataFrame(data["counts"])
         countData['heavy_vehicle'] = np.where(countData.vehicle_length < 17, 0, 1)
@@ -90,26 +120,7 @@ class GSReadyAggApp(etl_app.ETLApp):
         # While converting the timestamp to a string, we also convert it back to our local time zone to counter
         # the grouping/UTC workaround that was performed above.
         summarized["timestamp"] = summarized["timestamp"].dt.tz_convert(date_util.LOCAL_TIMEZONE).astype(str)
-        
-        # Update the header
-        header["processing_date"] = str(date_util.localize(arrow.now().datetime))
-        header["agg_interval_sec"] = self.args.agg * 60
-        
-        # Assemble together the aggregation file:
-        newFileContents = {"header": header,
-                           "data": summarized.apply(lambda x: x.to_dict(), axis=1).tolist(),
-                           "site": data["site"],
-                           "device": data["device"]}
-        
-        # Write the aggregation:
-        catalogElement = self.storageTgt.createCatalogElement(item.identifier.base, "agg%d.json" % self.args.agg,
-                                                              item.identifier.date, self.processingDate)
-        self.storageTgt.writeJSON(newFileContents, catalogElement)
-            
-        # Performance metrics logging:
-        self.perfmet.recordCollect(item.identifier.date, representsDay=True)
-        
-        return 1
+        return summarized
 
 def main(args=None):
     """
@@ -0,0 +1,79 @@
+"""
+Runs a chain of ETL stages within one process, one day at a time. What each stage writes to the Data Lake is handed
+directly to the following stages, which would otherwise retrieve it from the Data Lake again.
+
+@author Kenneth Perrine
+"""
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+import datetime
+import importlib
+import shlex
+
+import _setpath
+from atd_data_lake import config
+from atd_data_lake.support import handoff
+
+"CHAINS maps each data source to the stages that are run for it, in order."
+CHAINS = {"bt": ["bt_insert_lake", "bt_json_standard", "bt_ready", "bt_extract_soc"],
+          "wt": ["wt_insert_lake", "wt_json_standard", "wt_ready", "wt_extract_soc"],
+          "gs": ["gs_insert_lake", "gs_json_standard", "gs_ready", "gs_ready_agg", "gs_agg_extract_soc"]}
+
+def processArgs(argv=None):
+    """
+    Parses the command line. Arguments that aren't recognized here are passed along to every stage.
+
+    @return A tuple of the parsed arguments and the list of arguments for the stages
+    """
+    parser = ArgumentParser(prog="pipeline_fused.py",
+                            description="Runs a chain of ETL stages in one process, passing results between stages in memory",
+                            formatter_class=RawDescriptionHelpFormatter,
+                            epilog="Other arguments, such as --debug or --force, are passed along to every stage.")
+    parser.add_argument("chain", help="data source whose stages are run (%s), or a comma-separated list of stages" % ", ".join(CHAINS))
+    parser.add_argument("-s", "--start_date", required=True, help="start date, in YYYY-MM-DD format")
+    parser.add_argument("-e", "--end_date", required=True, help="end date (not included), in YYYY-MM-DD format")
+    parser.add_argument("--stage_args", nargs=2, action="append", default=[], metavar=("STAGE", "ARGS"),
+                        help="additional arguments for one stage, e.g. --stage_args bt_insert_lake \"-d /mnt/awam\"")
+    return parser.parse_known_args(argv)
+
+def main(args=None):
+    """
+    Main entry point. Allows for a list of arguments to bypass default command-line processing.
+    """
+    args, commonArgs = processArgs(args)
+    stages = CHAINS[args.chain] if args.chain in CHAINS else args.chain.split(",")
+    stageArgs = {}
+    for stage, stageArgStr in args.stage_args:
+        if stage not in stages:
+            raise ValueError("Stage '%s' from --stage_args isn't in the chain." % stage)
+        stageArgs.setdefault(stage, []).extend(shlex.split(stageArgStr))
+    modules = {stage: importlib.import_module(stage) for stage in stages}
+
+    date = datetime.datetime.strptime(args.start_date, "%Y-%m-%d").date()
+    endDate = datetime.datetime.strptime(args.end_date, "%Y-%m-%d").date()
+
+    stageHandoff = handoff.Handoff()
+    config.setHandoff(stageHandoff)
+    counts = {stage: 0 for stage in stages}
+    try:
+        while date < endDate:
+            nextDate = date + datetime.timedelta(days=1)
+            dateArgs = ["-s", date.isoformat(), "-e", nextDate.isoformat()]
+            for stage in stages:
+                print("=== %s: %s ===" % (date.isoformat(), stage))
+                counts[stage] += modules[stage].main(dateArgs + commonArgs + stageArgs.get(stage, []))
+            stageHandoff.clear()
+            date = nextDate
+    finally:
+        config.setHandoff(None)
+        stageHandoff.close()
+
+    for stage in stages:
+        print("%s: %d records processed" % (stage, counts[stage]))
+    print("Retrievals handed off between stages: %d" % stageHandoff.hits)
+    return sum(counts.values())
+
+if __name__ == "__main__":
+    """
+    Entry-point when run from the command-line
+    """
+    main()
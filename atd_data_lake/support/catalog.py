@@ -4,27 +4,70 @@ catalog.py: Interface for accessing the Data Lake Catalog
 Kenneth Perrine
 Center for Transportation Research, The University of Texas at Austin
 """
+from array import array
 import bisect
+from concurrent.futures import ThreadPoolExecutor
 import datetime
-
-import arrow
+import json
+import queue
+import sys
+import threading
+import time
 
 from atd_data_lake.util import date_util
+from atd_data_lake.support import perfmet, retry
+
+"QUERY_MANY_BASES is the maximum number of bases that are put into a single request by Catalog.prefetch()."
+QUERY_MANY_BASES = 50
+
+"UPSERT_BATCH_ROWS is the default maximum number of catalog elements that are sent in a single upsert request."
+UPSERT_BATCH_ROWS = 1000
+
+"UPSERT_BATCH_BYTES is the default maximum approximate JSON size of a single upsert request."
+UPSERT_BATCH_BYTES = 1000000
+
+"UPSERT_RETRIES is the default number of times that an upsert batch is retried after a transient failure."
+UPSERT_RETRIES = 3
+
+"LATEST_LOOKBACK_DAYS is how far back bulk queries for the latest catalog element of each base look."
+LATEST_LOOKBACK_DAYS = 31
+
+"READ_AHEAD_PAGES is the number of query result pages that the read-ahead thread may fetch ahead of the consumer."
+READ_AHEAD_PAGES = 1
 
 class Catalog:
     """
     Accessors for the Data Lake Catalog.
     """
-    def __init__(self, catalogConn, dataSource):
+    def __init__(self, catalogConn, dataSource, snapshot=None, batchRows=UPSERT_BATCH_ROWS, batchBytes=UPSERT_BATCH_BYTES,
+                 retries=UPSERT_RETRIES, upsertWorkers=1, readAhead=False):
         """
         Initializes catalog connection using the application object
         
         @param catalogConn: An object that establishes the connection to the catalog, a "driver"
         @param dataSource: The code that represents the data source that is being referred
+        @param snapshot: An optional catalog_snapshot.CatalogSnapshot that is consulted for queries before the driver
+        @param batchRows: The maximum number of elements that commitUpsert() sends in one request
+        @param batchBytes: The maximum approximate number of JSON bytes that commitUpsert() sends in one request
+        @param retries: The number of times commitUpsert() retries a failed batch before giving up on it
+        @param upsertWorkers: The number of batches that commitUpsert() may send concurrently
+        @param readAhead: Set this to True to have query() fetch the next page in a background thread
         """
         self.dbConn = catalogConn
         self.dataSource = dataSource
+        self.snapshot = snapshot
         self.upsertCache = {}
+        self.upsertLock = threading.RLock()
+        self.batchRows = batchRows
+        self.batchBytes = batchBytes
+        self.retries = retries
+        self.upsertWorkers = upsertWorkers
+        self.readAhead = readAhead
+        self.journal = None
+        
+        # Catalog entries retrieved by prefetch() for answering querySingle() from memory:
+        self.lookupCache = {}
+        self.lookupRange = None
         
     def getQueryList(self, stage, base, ext, earlyDate, lateDate, exactEarlyDate=False, limit=None, reverse=False):
         """
@@ -41,12 +84,12 @@ class Catalog:
         """
         The return from getSearchableQueryList() which has a function for returning the index to the next date
         """
-        def __init__(self, dates, catalogElements):
+        def __init__(self, catalogElements):
             """
-            Initializes variables
+            Initializes variables. The dates are kept as a compact array of integer microseconds since the epoch.
             """
-            self.dates = dates
-            self.catalogElements = catalogElements
+            self.dates = array("q", (date_util.toEpochMicros(x["collection_date"]) for x in catalogElements))
+            self.catalogElements = list(catalogElements)
             
         def __getitem__(self, index):
             """
@@ -59,19 +102,32 @@ class Catalog:
             Allows the len() function to be used on the object.
             """
             return len(self.catalogElements)
+        
+        def append(self, catalogElement):
+            """
+            Adds the given catalog element to the end, which must not be earlier than the others.
+            """
+            self.dates.append(date_util.toEpochMicros(catalogElement["collection_date"]))
+            self.catalogElements.append(catalogElement)
 
         def getNextDateIndex(self, date):
             """
             Returns the index into catalogElements that has the date equal or immediately greater from
             the given date.
             """
-            return bisect.bisect_left(self.dates, date)
+            return bisect.bisect_left(self.dates, date_util.toEpochMicros(date))
 
         def getNextDateIndexEx(self, date):
             """
             Returns the index into catalogElements that has the date immediately greater from the given date.
             """
-            return bisect.bisect_right(self.dates, date)
+            return bisect.bisect_right(self.dates, date_util.toEpochMicros(date))
+        
+        def isBefore(self, date):
+            """
+            Returns True if the last element comes before the given date.
+            """
+            return self.dates[-1] < date_util.toEpochMicros(date)
 
     def getSearchableQueryList(self, stage, base, ext, earlyDate, lateDate, exactEarlyDate=False, singleLatest=False, baseDict=False):
         """
@@ -99,7 +155,7 @@ class Catalog:
                 elif addedQueryItem["collection_date"] != queryList[-1]["collection_date"]:
                     queryList.append(addedQueryItem)
         if queryList:
-            return self._SearchableQueryList([x["collection_date"] for x in queryList], queryList)
+            return self._SearchableQueryList(queryList)
         return None
 
     class _SearchableQueryDict:
@@ -107,18 +163,21 @@ class Catalog:
         The return from getSearchableQueryDict() which has a function for returning the element for the next date.
         Also keeps track of whether the return/object is the same.
         """
-        def __init__(self, catObj, stage, ext):
+        def __init__(self, catObj, stage, ext, base=None):
             """
             Initializes variables
             
             @param catObj: To allow for impromptu querying if requested element is outside of the dict
             @param stage: Also needed for impromptu querying
+            @param base: The base filter that the dict had been built with
             """
             self.prevIndices = {}
             self.searchableLists = {}
             self.catObj = catObj
             self.stage = stage
             self.ext = ext
+            self.base = base
+            self.latestElements = None # base -> latest catalog element overall (or None), filled in by _getLatest()
         
         def getForNextDate(self, base, date, exclusive=False, forceValid=False):
             """
@@ -137,18 +196,30 @@ class Catalog:
             @param forceValud: When True, if the resulting date is out of range, returns the nearest in range
             """
             ret = self._getForDate(base, date, exclusive, nextFlag=False, forceValid=forceValid)
-            if not ret[0] or base in self.searchableLists and self.searchableLists[base].dates[-1] < date:
-                # This happens if the item isn't found from the earlier query. The following will perform a special query.
-                sqList = self.catObj.getSearchableQueryList(self.stage, base, self.ext, earlyDate=date, lateDate=None, singleLatest=True)
-                if sqList:
+            if not ret[0] or base in self.searchableLists and self.searchableLists[base].isBefore(date):
+                # This happens if the item isn't found from the earlier query. Use the latest element if it is newer:
+                latest = self._getLatest(base)
+                if latest and latest["collection_date"] >= date:
                     if base not in self.searchableLists:
-                        self.searchableLists[base] = sqList
-                    elif self.searchableLists[base].dates[-1] < sqList.dates[0]:
-                        self.searchableLists[base].dates.extend(sqList.dates)
-                        self.searchableLists[base].catalogElements.extend(sqList.catalogElements)
+                        self.searchableLists[base] = Catalog._SearchableQueryList([latest])
+                    elif self.searchableLists[base].isBefore(latest["collection_date"]):
+                        self.searchableLists[base].append(latest)
                     ret = self._getForDate(base, date, exclusive, nextFlag=True, forceValid=forceValid)
             return ret
         
+        def _getLatest(self, base):
+            """
+            Returns the latest catalog element for the given base, or None if there is none. The first call retrieves
+            the recent latest elements for all bases in one query, and bases that aren't found there are then queried
+            individually. All results are remembered.
+            """
+            if self.latestElements is None:
+                earlyDate = date_util.localize(date_util.getNow().replace(tzinfo=None) - datetime.timedelta(days=LATEST_LOOKBACK_DAYS))
+                self.latestElements = self.catObj.queryLatestPerBase(self.stage, self.base, self.ext, earlyDate, None)
+            if base not in self.latestElements:
+                self.latestElements[base] = self.catObj.queryLatest(self.stage, base, self.ext)
+            return self.latestElements[base]
+        
         def _getForDate(self, base, date, exclusive=False, nextFlag=True, forceValid=False):
             """
             Returns the catalog element for the previous or next date
@@ -165,7 +236,7 @@ class Catalog:
                 if not exclusive:
                     index = searchableList.getNextDateIndexEx(date) - 1
                 else:
-                    index = searchableList.getNextiDateIndex(date) - 1
+                    index = searchableList.getNextDateIndex(date) - 1
             else:
                 if not exclusive:
                     index = searchableList.getNextDateIndex(date)
@@ -187,7 +258,7 @@ class Catalog:
                 newFlag = True
             return searchableList[index], newFlag
 
-    def getSearchableQueryDict(self, stage, base, ext, earlyDate, lateDate, exactEarlyDate=False):
+    def getSearchableQueryDict(self, stage, base, ext, earlyDate, lateDate, exactEarlyDate=False, includePrior=False):
         """
         Returns a dictionary of catalog entries keyed by base and sorted by date that match the criteria. The searchQueryListNext()
         method can then be found to find the element that corresponds with the next date.
@@ -195,21 +266,25 @@ class Catalog:
         @param earlyDate: Set this to None to have no early date.
         @param lateDate: Set this to None to have no late date.
         @param exactEarlyDate: Set this to true to query only on exact date defined by the earlyDate parameter
+        @param includePrior: Set this to True to also include the latest entry for each base that comes before earlyDate,
+            retrieved in one query, so that getForPrevDate() finds it for dates early in the range.
         @return A _SearchableQueryDict object that contains dicts of _SearchableQueryList objects keyed off of base 
         """
         queryList = self.getQueryList(stage, base, ext, earlyDate, lateDate, exactEarlyDate)
+        if includePrior and earlyDate and not exactEarlyDate:
+            priorEarlyDate = date_util.localize(earlyDate.replace(tzinfo=None) - datetime.timedelta(days=LATEST_LOOKBACK_DAYS))
+            priorElements = self.queryLatestPerBase(stage, base, ext, priorEarlyDate, earlyDate)
+            queryList = sorted(priorElements.values(), key=lambda item: item["collection_date"]) + queryList
         
-        ret = self._SearchableQueryDict(self, stage, ext)
+        ret = self._SearchableQueryDict(self, stage, ext, base)
         if queryList:
             for item in queryList:
                 if item["id_base"] not in ret.searchableLists:
-                    ret.searchableLists[item["id_base"]] = self._SearchableQueryList([], [])
-                queryListObj = ret.searchableLists[item["id_base"]] 
-                queryListObj.dates.append(item["collection_date"])
-                queryListObj.catalogElements.append(item)
+                    ret.searchableLists[item["id_base"]] = self._SearchableQueryList([])
+                ret.searchableLists[item["id_base"]].append(item)
         return ret
     
-    def query(self, stage, base, ext, earlyDate, lateDate, exactEarlyDate=False, limit=None, reverse=False):
+    def query(self, stage, base, ext, earlyDate, lateDate, exactEarlyDate=False, limit=None, reverse=False, processedSince=None):
         """
         Returns a generator of catalog entries sorted by date that match the given criteria.
         
@@ -217,28 +292,100 @@ class Catalog:
         @param lateDate: Set this to None to have no late date.
         @param exactEarlyDate: Set this to true to query only on exact date defined by the earlyDate parameter
         @param limit: Optional limit on query results
-        """
-        offset = 0
-        while limit is None or offset < limit:
-            results = self.dbConn.query(self.dataSource, stage, base, ext, earlyDate, lateDate, \
-                exactEarlyDate=exactEarlyDate, limit=self.dbConn.getPreferredChunk(), start=offset, reverse=reverse)
+        @param processedSince: If specified, only returns entries with a processing date on or after this date
+        """
+        pages = self._queryPages(stage, base, ext, earlyDate, lateDate, exactEarlyDate, limit, reverse, processedSince)
+        if self.readAhead:
+            pages = _readAhead(pages, READ_AHEAD_PAGES)
+        for results in pages:
+            for item in results:
+                yield _CatalogRow(item)
+    
+    def _queryPages(self, stage, base, ext, earlyDate, lateDate, exactEarlyDate, limit, reverse, processedSince=None):
+        """
+        Returns a generator of the raw result pages from the catalog driver (or snapshot) for query().
+        """
+        queryConn = self.snapshot if self.snapshot else self.dbConn
+        chunk = self.dbConn.getPreferredChunk()
+        count = 0
+        after = None
+        while limit is None or count < limit:
+            # Pages are requested by key rather than by offset so that deep listings stay fast and stable while upserts happen:
+            pageSize = chunk if limit is None else min(chunk, limit - count)
+            with perfmet.span("catalog_query"):
+                results = queryConn.query(self.dataSource, stage, base, ext, earlyDate, lateDate, \
+                    exactEarlyDate=exactEarlyDate, limit=pageSize, reverse=reverse, after=after, processedSince=processedSince)
             if results:
-                for item in results:
-                    if item["collection_date"]:
-                        item["collection_date"] = date_util.localize(arrow.get(item["collection_date"]).datetime)
-                    if item["collection_end"]:
-                        item["collection_end"] = date_util.localize(arrow.get(item["collection_end"]).datetime)
-                    if item["processing_date"]:
-                        item["processing_date"] = date_util.localize(arrow.get(item["processing_date"]).datetime)
-                    yield item
-            if not results or len(results) < self.dbConn.getPreferredChunk():
+                after = (results[-1]["collection_date"], results[-1]["id_base"], results[-1]["id_ext"])
+                yield results
+            if not results or len(results) < pageSize:
                 break
-            offset += len(results)
+            count += len(results)
+        
+    def prefetch(self, stage, bases, ext, earlyDate, lateDate):
+        """
+        Retrieves all catalog entries for the given bases between earlyDate and lateDate (inclusive) using only a few
+        requests, so that subsequent querySingle() calls that fall within these criteria are answered from memory.
+        This replaces entries from the previous prefetch() call.
+        
+        @param bases: A collection of exact base names
+        @param ext: An exact ext name, or None for all ext names
+        """
+        bases = sorted(set(bases))
+        self.lookupCache = {}
+        self.lookupRange = None
+        lateDateEx = date_util.localize(lateDate.replace(tzinfo=None) + datetime.timedelta(seconds=1))
+        for index in range(0, len(bases), QUERY_MANY_BASES):
+            for item in self.query(stage, bases[index:index + QUERY_MANY_BASES], ext, earlyDate, lateDateEx):
+                self.lookupCache[(item["id_base"], item["id_ext"], item["collection_date"])] = item
+        self.lookupRange = (stage, frozenset(bases), ext, earlyDate, lateDate)
+    
+    def queryMany(self, stage, keys):
+        """
+        Looks up many catalog entries at once. Returns a dictionary keyed by each of the given (base, ext, collectionDate)
+        keys, with the catalog entry or None as values. Later querySingle() calls on these keys are answered from memory.
+        """
+        keys = list(keys)
+        if not keys:
+            return {}
+        exts = set(key[1] for key in keys)
+        dates = [key[2] for key in keys]
+        self.prefetch(stage, [key[0] for key in keys], exts.pop() if len(exts) == 1 else None, min(dates), max(dates))
+        return {key: self.querySingle(stage, *key) for key in keys}
+        
+    def _lookupPrefetched(self, stage, base, ext, collectionDate):
+        """
+        Returns a tuple of True and the catalog entry (or None if it doesn't exist) if the criteria fall within what
+        had been retrieved by prefetch(); otherwise, returns False and None.
+        """
+        if self.lookupRange:
+            rangeStage, rangeBases, rangeExt, earlyDate, lateDate = self.lookupRange
+            if stage == rangeStage and base in rangeBases and ext is not None and "%%" not in ext \
+                    and (rangeExt is None or rangeExt == ext) \
+                    and earlyDate <= collectionDate <= lateDate:
+                return True, self.lookupCache.get((base, ext, collectionDate))
+        return False, None
+        
+    def queryLatestPerBase(self, stage, base, ext, earlyDate=None, lateDate=None):
+        """
+        Returns a dict of the latest catalog entry for each base that matches the criteria, using one paged query.
         
+        @param earlyDate: Set this to None to have no early date; this bounds how many entries are scanned.
+        @param lateDate: Set this to None to have no late date (exclusive).
+        """
+        ret = {}
+        for item in self.query(stage, base, ext, earlyDate, lateDate, reverse=True):
+            if item["id_base"] not in ret:
+                ret[item["id_base"]] = item
+        return ret
+    
     def querySingle(self, stage, base, ext, collectionDate):
         """
         Attempts to query for a single item given the criteria.
         """
+        found, result = self._lookupPrefetched(stage, base, ext, collectionDate)
+        if found:
+            return result
         results = self.getQueryList(stage, base, ext, collectionDate, lateDate=None, exactEarlyDate=True, limit=1)
         return results[0] if results else None
         
@@ -285,7 +432,10 @@ class Catalog:
         Stages an upsert using a catalog element.
         """
         key = (catalogElement["repository"], catalogElement["data_source"], catalogElement["id_base"], catalogElement["id_ext"], catalogElement["collection_date"])
-        self.upsertCache[key] = catalogElement # Overwrite if duplicate to avoid problems with PostgREST.
+        with self.upsertLock:
+            self.upsertCache[key] = catalogElement # Overwrite if duplicate to avoid problems with PostgREST.
+            if self.journal:
+                self.journal.recordStaged(catalogElement)
     
     def stageUpsertParams(self, stage, base, ext, collectionDate, processingDate, path, collectionEnd=None, metadata=None):
         """
@@ -298,6 +448,9 @@ class Catalog:
         Performs an immediate upsert using the given catalogElement object.
         """
         self.dbConn.upsert(catalogElement)
+        if self.snapshot:
+            self.snapshot.upsert(catalogElement)
+        self._invalidatePrefetched([catalogElement])
     
     def upsertParams(self, stage, base, ext, collectionDate, processingDate, path, collectionEnd=None, metadata=None):
         """
@@ -305,11 +458,220 @@ class Catalog:
         """
         self.upsert(self.buildCatalogElement(stage, base, ext, collectionDate, processingDate, path, collectionEnd, metadata))
     
+    def setJournal(self, journal):
+        """
+        Sets a journal.Journal that records staged elements and commits, so that a later run can replay those that
+        hadn't been committed. Use None to stop journaling.
+        """
+        with self.upsertLock:
+            self.journal = journal
+    
     def commitUpsert(self):
         """
-        Flushes all of the queued upsert items to the catalog.
+        Flushes all of the queued upsert items to the catalog. These are sent in batches that are bounded by row count
+        and size, and a failed batch is retried with backoff. Elements of batches that still fail are left in the
+        queue, and an exception is then raised after all other batches had been sent.
         """
-        if self.upsertCache:
-            self.dbConn.upsert(list(self.upsertCache.values()))
-            self.upsertCache.clear()
-        
+        with self.upsertLock:
+            hadItems = bool(self.upsertCache)
+            self._commitUpsert()
+            if hadItems and self.journal:
+                self.journal.recordFlushed()
+    
+    def _commitUpsert(self):
+        """
+        Performs commitUpsert() while the upsert lock is held.
+        """
+        if not self.upsertCache:
+            return
+        batches = self._buildUpsertBatches()
+        failure = None
+        if self.upsertWorkers > 1 and len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=min(self.upsertWorkers, len(batches))) as executor:
+                futures = [executor.submit(self._upsertBatch, [self.upsertCache[key] for key in batch]) for batch in batches]
+                for batch, future in zip(batches, futures):
+                    try:
+                        future.result()
+                        self._commitBatch(batch)
+                    except Exception as exc:
+                        failure = exc
+        else:
+            for batch in batches:
+                try:
+                    self._upsertBatch([self.upsertCache[key] for key in batch])
+                    self._commitBatch(batch)
+                except Exception as exc:
+                    failure = exc
+        if failure:
+            print("ERROR: %d catalog element(s) could not be upserted and remain queued." % len(self.upsertCache))
+            raise failure
+    
+    def _buildUpsertBatches(self):
+        """
+        Splits the keys of the queued upsert items into lists that fit within the batch row and byte limits.
+        """
+        batches = []
+        batch = []
+        batchSize = 0
+        for key, element in self.upsertCache.items():
+            elementSize = len(json.dumps(element)) + 1
+            if batch and (len(batch) >= self.batchRows or batchSize + elementSize > self.batchBytes):
+                batches.append(batch)
+                batch = []
+                batchSize = 0
+            batch.append(key)
+            batchSize += elementSize
+        if batch:
+            batches.append(batch)
+        return batches
+    
+    def _upsertBatch(self, upsertList):
+        """
+        Sends one batch of catalog elements to the catalog, retrying with backoff upon transient failures. Other
+        errors are raised right away.
+        """
+        attempt = 0
+        while True:
+            try:
+                with perfmet.span("catalog_upsert"):
+                    self.dbConn.upsert(upsertList)
+                return
+            except Exception as exc:
+                if attempt >= self.retries or not retry.isTransient(exc):
+                    raise
+                delay = retry.getBackoff(attempt)
+                attempt += 1
+                print("WARNING: Catalog upsert of %d element(s) failed (%s); retry %d of %d in %g seconds." \
+                      % (len(upsertList), str(exc), attempt, self.retries, delay))
+                time.sleep(delay)
+    
+    def _commitBatch(self, batch):
+        """
+        Removes a successfully sent batch from the upsert queue and mirrors it to the snapshot.
+        """
+        upsertList = [self.upsertCache.pop(key) for key in batch]
+        if self.snapshot:
+            self.snapshot.upsert(upsertList)
+        self._invalidatePrefetched(upsertList)
+
+    def _invalidatePrefetched(self, catalogElements):
+        """
+        Forgets about the prefetch() results if any of the given catalog elements that were written may fall within them.
+        """
+        if self.lookupRange and any(element["repository"] == self.lookupRange[0] for element in catalogElements):
+            self.lookupCache = {}
+            self.lookupRange = None
+            
+    def refresh(self):
+        """
+        Causes the local catalog snapshot, if used, to pick up new remote entries on the next query.
+        """
+        if self.snapshot:
+            self.snapshot.refresh()
+
+def _readAhead(generator, depth):
+    """
+    Runs the given generator in a background thread, keeping up to depth items ready in a bounded queue. Exceptions
+    raised in the thread are raised again to the consumer. If the consumer stops early, the thread stops as well.
+    """
+    itemQueue = queue.Queue(maxsize=depth)
+    stopEvent = threading.Event()
+    done = object()
+    
+    def put(entry):
+        while not stopEvent.is_set():
+            try:
+                itemQueue.put(entry, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+    
+    def producer():
+        try:
+            for item in generator:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except Exception as exc:
+            put((done, exc))
+    
+    thread = threading.Thread(target=producer, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, exc = itemQueue.get()
+            if item is done:
+                if exc:
+                    raise exc
+                return
+            yield item
+    finally:
+        stopEvent.set()
+
+class _CatalogRow(dict):
+    """
+    A catalog query result that converts its date fields from strings to local datetime objects upon first access, so
+    that fields the caller never reads don't cost anything. A date field that holds a string is converted whenever it
+    is read. Base and ext strings are interned so that the many rows sharing them share one copy.
+    """
+    __slots__ = ()
+    
+    "_DATE_FIELDS are the fields that are converted to datetime objects."
+    _DATE_FIELDS = ("collection_date", "collection_end", "processing_date")
+    
+    def __init__(self, item):
+        super().__init__(item)
+        for key in ("id_base", "id_ext"):
+            value = dict.get(self, key)
+            if isinstance(value, str):
+                dict.__setitem__(self, key, sys.intern(value))
+    
+    def _resolve(self, key):
+        if key in self._DATE_FIELDS:
+            value = dict.get(self, key)
+            if isinstance(value, str):
+                dict.__setitem__(self, key, date_util.parseISOLocal(value))
+            
+    def _resolveAll(self):
+        for key in self._DATE_FIELDS:
+            self._resolve(key)
+    
+    def __getitem__(self, key):
+        self._resolve(key)
+        return dict.__getitem__(self, key)
+    
+    def get(self, key, default=None):
+        self._resolve(key)
+        return dict.get(self, key, default)
+    
+    def pop(self, key, *args):
+        self._resolve(key)
+        return dict.pop(self, key, *args)
+    
+    def __iter__(self):
+        # Overriding this also steers dict(), ** and json through __getitem__().
+        self._resolveAll()
+        return dict.__iter__(self)
+    
+    def items(self):
+        self._resolveAll()
+        return dict.items(self)
+    
+    def values(self):
+        self._resolveAll()
+        return dict.values(self)
+    
+    def copy(self):
+        self._resolveAll()
+        return dict(self)
+    
+    def __eq__(self, other):
+        self._resolveAll()
+        return dict.__eq__(self, other)
+    
+    __hash__ = None
+    
+    def __repr__(self):
+        self._resolveAll()
+        return dict.__repr__(self)
@@ -0,0 +1,125 @@
+"""
+catalog_snapshot.py: Persistent local snapshot of the Data Lake Catalog, incrementally synchronized
+
+Kenneth Perrine
+Center for Transportation Research, The University of Texas at Austin
+"""
+import os
+import threading
+
+from atd_data_lake.drivers.catalog_sqlite import CatalogSQLite, toMicros
+
+class CatalogSnapshot:
+    """
+    Keeps a local SQLite copy of the catalog entries for each repository and data source. The first query against a
+    repository pulls the catalog rows whose processing_date is newer than the stored watermark, and then all
+    range/base/ext queries are answered locally. This implements the same query() interface as the catalog drivers.
+
+    Caveat: Entries that are removed from the remote catalog, or that are upserted with an older processing_date
+    than the watermark, aren't seen by the incremental synchronization. Delete the snapshot file to start over.
+    """
+    def __init__(self, remoteConn, snapshotDir):
+        """
+        Initializes the object.
+
+        @param remoteConn: The catalog driver (e.g. catalog_postgrest.CatalogPostgREST) that is the authoritative source
+        @param snapshotDir: The directory that snapshot files are written to
+        """
+        self.remoteConn = remoteConn
+        self.snapshotDir = snapshotDir
+        self.stores = {} # (dataSource, stage) -> CatalogSQLite
+        self.synced = set()
+        self.lock = threading.RLock()
+        os.makedirs(snapshotDir, exist_ok=True)
+
+    def _getStore(self, dataSource, stage):
+        """
+        Returns the local catalog store for the given data source and repository, creating the file if needed.
+        """
+        key = (dataSource, stage)
+        if key not in self.stores:
+            store = CatalogSQLite(os.path.join(self.snapshotDir, "%s_%s.sqlite" % (dataSource, stage)))
+            store.dbConn.execute("""CREATE TABLE IF NOT EXISTS sync_state (
+  repository TEXT NOT NULL,
+  data_source TEXT NOT NULL,
+  watermark TEXT,
+  watermark_ts INTEGER,
+  PRIMARY KEY (repository, data_source))""")
+            store.dbConn.commit()
+            self.stores[key] = store
+        return self.stores[key]
+
+    def sync(self, dataSource, stage):
+        """
+        Pulls catalog entries from the remote catalog that have been processed since the last synchronization. This
+        only happens once per stage unless refresh() is called.
+        """
+        with self.lock:
+            if (dataSource, stage) in self.synced:
+                return
+            store = self._getStore(dataSource, stage)
+            row = store.dbConn.execute("SELECT watermark, watermark_ts FROM sync_state WHERE repository = ? AND data_source = ?",
+                                       (stage, dataSource)).fetchone()
+            watermark, watermarkTS = row if row else (None, None)
+
+            # Rows sharing the watermark timestamp are pulled again; this is harmless because these are upserted.
+            processedSince = watermark
+            count = 0
+            after = None
+            chunk = self.remoteConn.getPreferredChunk()
+            while True:
+                results = self.remoteConn.query(dataSource, stage, None, None, limit=chunk, after=after, processedSince=processedSince)
+                if results:
+                    after = (results[-1]["collection_date"], results[-1]["id_base"], results[-1]["id_ext"])
+                    for item in results:
+                        if item["processing_date"]:
+                            processingTS = toMicros(item["processing_date"])
+                            if watermarkTS is None or processingTS > watermarkTS:
+                                watermark, watermarkTS = item["processing_date"], processingTS
+                    store.upsert([dict(item, repository=stage, data_source=dataSource) for item in results], commit=False)
+                    count += len(results)
+                if not results or len(results) < chunk:
+                    break
+            store.dbConn.execute("INSERT OR REPLACE INTO sync_state (repository, data_source, watermark, watermark_ts) VALUES (?, ?, ?, ?)",
+                                 (stage, dataSource, watermark, watermarkTS))
+            store.dbConn.commit()
+            print("INFO: Catalog snapshot for '%s' synchronized %d entries." % (stage, count))
+            self.synced.add((dataSource, stage))
+
+    def refresh(self):
+        """
+        Causes the next query on each stage to synchronize again with the remote catalog.
+        """
+        with self.lock:
+            self.synced.clear()
+
+    def query(self, dataSource, stage, base, ext, earlyDate=None, lateDate=None, exactEarlyDate=False, limit=None, start=None, reverse=False,
+              after=None, processedSince=None):
+        """
+        Performs a query on the snapshot using the same parameters as the catalog drivers, synchronizing first if needed.
+        Returns a list of dictionary objects, each a result.
+        """
+        self.sync(dataSource, stage)
+        return self._getStore(dataSource, stage).query(dataSource, stage, base, ext, earlyDate, lateDate, exactEarlyDate=exactEarlyDate,
+                                                       limit=limit, start=start, reverse=reverse, after=after,
+                                                       processedSince=processedSince)
+
+    def upsert(self, upsertDataList):
+        """
+        Records catalog elements that had been successfully upserted to the remote catalog. This doesn't move the
+        watermark, so entries written by other processes in the meantime will still be found at the next sync.
+        """
+        if not isinstance(upsertDataList, list):
+            upsertDataList = [upsertDataList]
+        with self.lock:
+            byStage = {}
+            for element in upsertDataList:
+                byStage.setdefault((element["data_source"], element["repository"]), []).append(element)
+            for (dataSource, stage), elements in byStage.items():
+                self._getStore(dataSource, stage).upsert(elements)
+
+    def getPreferredChunk(self):
+        """
+        Returns the preferred chunk size that catalog.Catalog.query() should use in requests.
+        """
+        return self.remoteConn.getPreferredChunk()
@@ -0,0 +1,122 @@
+"""
+compression.py: Optional compression of objects written to the Data Lake, with detection of the encoding upon reading
+
+@author Kenneth Perrine
+"""
+import gzip
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+"ENCODINGS are the names of the supported encodings, with the compression level that each is written with."
+ENCODINGS = {"gzip": 6, "zstd": 3}
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+def checkEncoding(encoding):
+    """
+    Raises an exception if the given encoding (or None for no compression) can't be used.
+    """
+    if encoding is None:
+        return
+    if encoding not in ENCODINGS:
+        raise ValueError("Unsupported encoding '%s'; use one of: %s" % (encoding, ", ".join(ENCODINGS)))
+    if encoding == "zstd" and not zstandard:
+        raise ImportError("The 'zstandard' package is needed for the 'zstd' encoding.")
+
+def detectEncoding(prefix):
+    """
+    Returns the encoding that the given first bytes of an object indicate, or None if it isn't compressed.
+    """
+    if prefix.startswith(_GZIP_MAGIC):
+        return "gzip"
+    if prefix.startswith(_ZSTD_MAGIC):
+        return "zstd"
+    return None
+
+def openWriter(fileObj, encoding):
+    """
+    Returns a binary file object that compresses what is written to it into the given binary file object. Closing it
+    finishes the compressed data, but leaves fileObj open.
+    """
+    checkEncoding(encoding)
+    if encoding == "gzip":
+        # The timestamp is left out so that the same contents always compress the same way:
+        return gzip.GzipFile(fileobj=fileObj, mode="wb", compresslevel=ENCODINGS[encoding], mtime=0)
+    return zstandard.ZstdCompressor(level=ENCODINGS[encoding]).stream_writer(fileObj, closefd=False)
+
+def openReader(fileObj):
+    """
+    Returns a binary file object that reads the decompressed contents of the given binary file object, which may or
+    may not be compressed. Closing the returned object also closes fileObj.
+    """
+    reader = _PrefixedReader(fileObj)
+    encoding = detectEncoding(reader.peek(len(_ZSTD_MAGIC)))
+    if encoding == "gzip":
+        return _DecodingReader(gzip.GzipFile(fileobj=reader, mode="rb"), reader)
+    if encoding == "zstd":
+        checkEncoding(encoding)
+        return _DecodingReader(zstandard.ZstdDecompressor().stream_reader(reader, read_across_frames=True), reader)
+    return reader
+
+def decodeBytes(data, encoding):
+    """
+    Returns the decompressed contents of the given bytes that had been compressed with the given encoding, or the
+    bytes as they are if the encoding is None.
+    """
+    checkEncoding(encoding)
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    if encoding == "zstd":
+        with zstandard.ZstdDecompressor().stream_reader(data, read_across_frames=True) as reader:
+            return reader.read()
+    return data
+
+class _PrefixedReader:
+    """
+    Allows the first bytes of a stream that can't seek, like a download, to be looked at before reading it.
+    """
+    def __init__(self, fileObj):
+        self.fileObj = fileObj
+        self.prefix = b""
+
+    def peek(self, size):
+        while len(self.prefix) < size:
+            data = self.fileObj.read(size - len(self.prefix))
+            if not data:
+                break
+            self.prefix += data
+        return self.prefix
+
+    def read(self, size=-1):
+        if not self.prefix:
+            return self.fileObj.read(size)
+        if size is None or size < 0:
+            ret = self.prefix + self.fileObj.read()
+        else:
+            ret = self.prefix[:size]
+            if len(ret) < size:
+                ret += self.fileObj.read(size - len(ret))
+        self.prefix = self.prefix[len(ret):] if size is not None and size >= 0 else b""
+        return ret
+
+    def close(self):
+        self.fileObj.close()
+
+class _DecodingReader:
+    """
+    Reads through a decompressor, and closes the underlying stream along with it.
+    """
+    def __init__(self, decoder, source):
+        self.decoder = decoder
+        self.source = source
+
+    def read(self, size=-1):
+        return self.decoder.read(size)
+
+    def close(self):
+        self.decoder.close()
+        self.source.close()
@@ -0,0 +1,132 @@
+"""
+coverage.py: Compact index of the dates that a repository already covers, used for LastUpdate comparisons
+
+@author Kenneth Perrine
+"""
+from array import array
+import base64
+import bisect
+import datetime
+import json
+
+from atd_data_lake.util import date_util
+
+class CoverageIndex:
+    """
+    Records the start times of the entries that exist for each key (e.g. a base, or a (base, ext) tuple), and answers
+    whether any entry starts within a given time range. Entries that start at local midnight, which is nearly all of
+    them, take one bit per day; other start times are kept in a sorted integer array.
+    """
+    class _KeyCoverage:
+        """
+        The coverage for a single key.
+        """
+        __slots__ = ("firstDay", "days", "times")
+
+        def __init__(self):
+            self.firstDay = None # Day ordinal that corresponds with the first bit in days
+            self.days = bytearray()
+            self.times = array("q")
+
+        def addDay(self, day):
+            if self.firstDay is None:
+                self.firstDay = day & ~7
+            elif day < self.firstDay:
+                newFirstDay = day & ~7
+                self.days[0:0] = bytes((self.firstDay - newFirstDay) >> 3)
+                self.firstDay = newFirstDay
+            offset = day - self.firstDay
+            if (offset >> 3) >= len(self.days):
+                self.days.extend(bytes((offset >> 3) - len(self.days) + 1))
+            self.days[offset >> 3] |= 1 << (offset & 7)
+
+        def hasDay(self, day):
+            if self.firstDay is None or day < self.firstDay:
+                return False
+            offset = day - self.firstDay
+            return (offset >> 3) < len(self.days) and bool(self.days[offset >> 3] & (1 << (offset & 7)))
+
+    def __init__(self):
+        """
+        Initializes an empty index.
+        """
+        self.keys = {}
+
+    def add(self, key, date):
+        """
+        Records that an entry for the given key starts at the given date.
+        """
+        date = date_util.localize(date)
+        if key not in self.keys:
+            self.keys[key] = self._KeyCoverage()
+        keyCoverage = self.keys[key]
+        if _isMidnight(date):
+            keyCoverage.addDay(date.toordinal())
+        else:
+            micros = date_util.toEpochMicros(date)
+            index = bisect.bisect_left(keyCoverage.times, micros)
+            if index == len(keyCoverage.times) or keyCoverage.times[index] != micros:
+                keyCoverage.times.insert(index, micros)
+
+    def covers(self, key, date, dateEnd=None):
+        """
+        Returns True if any entry for the given key starts on or after date and before dateEnd.
+
+        @param dateEnd: The end of the range (exclusive), or None for one day after date
+        """
+        keyCoverage = self.keys.get(key)
+        if not keyCoverage:
+            return False
+        date = date_util.localize(date)
+        if dateEnd:
+            dateEnd = date_util.localize(dateEnd)
+        else:
+            dateEnd = date_util.localize(date.replace(tzinfo=None) + datetime.timedelta(days=1))
+
+        # Midnights that fall within [date, dateEnd):
+        firstDay = date.toordinal() + (0 if _isMidnight(date) else 1)
+        endDay = dateEnd.toordinal() + (0 if _isMidnight(dateEnd) else 1)
+        for day in range(firstDay, endDay):
+            if keyCoverage.hasDay(day):
+                return True
+        if keyCoverage.times:
+            index = bisect.bisect_left(keyCoverage.times, date_util.toEpochMicros(date))
+            if index < len(keyCoverage.times) and keyCoverage.times[index] < date_util.toEpochMicros(dateEnd):
+                return True
+        return False
+
+    def __len__(self):
+        return len(self.keys)
+
+    def save(self, path):
+        """
+        Writes the index to the given file.
+        """
+        contents = [{"key": list(key) if isinstance(key, tuple) else key,
+                     "first_day": keyCoverage.firstDay,
+                     "days": base64.b64encode(bytes(keyCoverage.days)).decode("ascii"),
+                     "times": keyCoverage.times.tolist()} for key, keyCoverage in self.keys.items()]
+        with open(path, "w") as fileObj:
+            json.dump(contents, fileObj)
+
+    @staticmethod
+    def load(path):
+        """
+        Returns a new index that is read from the given file, as written by save().
+        """
+        ret = CoverageIndex()
+        with open(path, "r") as fileObj:
+            contents = json.load(fileObj)
+        for item in contents:
+            keyCoverage = CoverageIndex._KeyCoverage()
+            keyCoverage.firstDay = item["first_day"]
+            keyCoverage.days = bytearray(base64.b64decode(item["days"]))
+            keyCoverage.times = array("q", item["times"])
+            ret.keys[tuple(item["key"]) if isinstance(item["key"], list) else item["key"]] = keyCoverage
+        return ret
+
+def _isMidnight(date):
+    """
+    Returns True if the given localized date falls exactly on midnight.
+    """
+    return not (date.hour or date.minute or date.second or date.microsecond)
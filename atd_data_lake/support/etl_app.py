@@ -6,19 +6,38 @@ Center for Transportation Research, The University of Texas at Austin
 """
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import json
+import os
 import tempfile
 import shutil
+import time
+import traceback
 
 import arrow
 
 from atd_data_lake import config
 from atd_data_lake.util import date_util
-from atd_data_lake.support import last_update
+from atd_data_lake.support import last_update, journal, retry
+from atd_data_lake.support.coverage import CoverageIndex
 
 # TODO: Determine if we want to limit by certain number of days if no lower bound, or throw an exception.
 #"Number of months to go back for filing records"
 #DATE_EARLIEST = 365
 
+"DAEMON_OVERLAP: How much earlier than the previous cycle each daemon cycle looks for newly processed target entries"
+DAEMON_OVERLAP = datetime.timedelta(minutes=30)
+
+"COVERAGE_REBUILD_AGE: How often daemon mode queries the whole target again, to pick up entries that were written by other processes and committed too late for DAEMON_OVERLAP"
+COVERAGE_REBUILD_AGE = datetime.timedelta(hours=6)
+
+"QUARANTINE_EXPIRY: How long an item that had run out of retries on transient errors stays quarantined in daemon mode; items with permanent errors stay quarantined"
+QUARANTINE_EXPIRY = datetime.timedelta(hours=6)
+
+"UNIT_DATA_MAX_AGE: How long unit data from retrieveUnitData() is reused in daemon mode before it is retrieved again"
+UNIT_DATA_MAX_AGE = datetime.timedelta(hours=1)
+
 """
 AppDescription:
 appName: The name of the application (short string)
@@ -31,11 +50,16 @@ class ETLApp:
     ETLApp is a holding place for application-wide parameters that contain driver connection
     objects and application-wide parameters.    
     """
+    "parallelItems: Set this to False in subclasses whose innerLoopActivity() depends on items being handled in order."
+    parallelItems = True
+    "resumableItems: Set this to False in subclasses that don't finish an item's work within innerLoopActivity(); their items aren't skipped on resume or quarantined."
+    resumableItems = True
+    
     def __init__(self, dataSource, appDescription, args=None, purposeSrc=None, purposeTgt=None, needsTempDir=True, parseDateOnly=True, perfmetStage=None):
         """
         Constructor initializes variables.
         
-        @param args: Collection of command-line arguments; use None to allow the default command line to be parsed
+        @param args: Collection of command-line arguments, or a list of argument strings to parse; use None to allow the default command line to be parsed
         @param dataSource: The data source abbreviation for application activities
         @param purposeSrc: A purpose string for the source, used to get the source repository name
         @param purposeTgt: The purpose string for the target, used to get the target repository name
@@ -63,6 +87,19 @@ class ETLApp:
         self.productionMode = None
         self.simulationMode = False
         self.writeFilePath = None
+        self.streamCompare = False
+        self.workers = 1
+        self.checkpoint = None
+        self.planPath = None
+        self.interval = None
+        self.startDaysBack = None
+        self.retries = 0
+        self.quarantined = {}
+        
+        # State kept between cycles in daemon mode:
+        self.coverageCache = {}
+        self.unitDataCache = None
+        self.unitDataProvs = {}
 
         # General configuration variables:        
         self.needsTempDir = needsTempDir
@@ -76,8 +113,8 @@ class ETLApp:
         self.prevDate = None
                 
         # Parse the command line:
-        if not args:
-            args = self.processArgs(appDescription)
+        if not args or isinstance(args, list):
+            args = self.processArgs(appDescription, args or None)
         
         # Welcome message:
         print("== Starting " + appDescription.appName + " ==")
@@ -87,9 +124,11 @@ class ETLApp:
         self._ingestArgs(args)
         self._connect()
 
-    def processArgs(self, cmdLineConfig):
+    def processArgs(self, cmdLineConfig, argv=None):
         """
         Builds up the command line processor with standard parameters and also custom parameters that are passed in.
+        
+        @param argv: A list of argument strings to parse in place of the actual command line
         """
         parser = ArgumentParser(prog=cmdLineConfig.appName,
                                 description=cmdLineConfig.appDescr,
@@ -106,13 +145,19 @@ class ETLApp:
         parser.add_argument("-F", "--force", action="store_true", help="force overwrite of records regardless of history")
         parser.add_argument("-o", "--output_filepath", help="specify a path to output files to a specific directory")
         parser.add_argument("-0", "--simulate", action="store_true", help="simulates the writing of files to the filestore and catalog")
+        parser.add_argument("--workers", type=int, default=1, help="number of items to process concurrently within each date")
+        parser.add_argument("--stream_compare", action="store_true", help="reads target history alongside the source to save memory; source must be in date order")
+        parser.add_argument("--retries", type=int, default=0, help="retries an item up to the given number of times on transient errors, then sets it aside so others can proceed")
+        parser.add_argument("--interval", type=float, help="keeps running as a daemon, repeating the process every given number of minutes")
+        parser.add_argument("--plan", nargs="?", const="-", help="lists the items that would be processed with their sizes as JSON to the given path or the console, and stops")
+        parser.add_argument("--checkpoint", help="keeps a journal at the given path so that an interrupted run resumes where it left off")
         # TODO: Enable the logging features.
         #parser.add_argument("-L", "--logfile", help="enables logfile output to the given path")
         #parser.add_argument("--log_autoname", help="automatically create the log name from app parameters")
         parser.add_argument("--debug", action="store_true", help="sets the code to run in debug mode, which usually causes access to non-production storage")
         
         # TODO: Consider parameters for writing out files?
-        args = parser.parse_args()
+        args = parser.parse_args(argv)
         return args
     
     def _addCustomArgs(self, parser):
@@ -139,10 +184,8 @@ class ETLApp:
         # Start date, or number of days back:
         if hasattr(args, "start_date") and args.start_date:
             try:
-                dateEarliest = int(args.start_date)
-                self.startDate = date_util.localize(arrow.now()
-                    .replace(hour=0, minute=0, second=0, microsecond=0)
-                    .shift(days=-dateEarliest).datetime)
+                self.startDaysBack = int(args.start_date)
+                self.startDate = _getDaysBack(self.startDaysBack)
             except ValueError:
                 self.startDate = date_util.parseDate(args.start_date, dateOnly=self.parseDateOnly)
         else:
@@ -186,6 +229,31 @@ class ETLApp:
             self.simulationMode = args.simulate
             if self.simulationMode:
                 print("INFO: Simulated write mode is enabled.")
+        if hasattr(args, "workers") and args.workers and args.workers > 1:
+            if self.parallelItems:
+                self.workers = args.workers
+                print("INFO: Processing with %d workers." % self.workers)
+            else:
+                print("INFO: This process handles items in order; the workers option is ignored.")
+        if hasattr(args, "stream_compare"):
+            self.streamCompare = args.stream_compare
+            if self.streamCompare:
+                print("INFO: Streaming comparison is enabled.")
+        if hasattr(args, "retries") and args.retries:
+            self.retries = args.retries
+            print("INFO: Items are retried up to %d time(s), and then quarantined." % self.retries)
+        if hasattr(args, "interval"):
+            self.interval = args.interval
+            if self.interval:
+                print("INFO: Daemon mode is enabled: repeating every %g minute(s)." % self.interval)
+        if hasattr(args, "plan"):
+            self.planPath = args.plan
+            if self.planPath:
+                print("INFO: Planning mode is enabled: items will not be processed.")
+        if hasattr(args, "checkpoint"):
+            self.checkpoint = args.checkpoint
+            if self.checkpoint:
+                print("INFO: Checkpoint journal is: %s" % self.checkpoint)
         if hasattr(args, "output_filepath"):
             self.writeFilePath = args.output_filepath
             if self.writeFilePath:
@@ -221,30 +289,82 @@ class ETLApp:
 
     def doMainLoop(self):
         """
-        Coordinates the main loop activity
+        Coordinates the main loop activity. In daemon mode, etlActivity() is repeated at the given interval until the
+        process is interrupted, and a performance metrics job is logged for each cycle.
         """
         # TODO: Add in benchmarking
         
         # TODO: Add in a preparation method call?
         
-        # --- BEGIN STUFF. TODO: Support for loop over time period at intervals (with functional disable for that)?
         self.runCount = 1
         recsProcessed = 0
-        self.processingDate = date_util.localize(arrow.now().datetime)
-        
-        # TODO: Exception handling with retry ability?
-        
-        recsProcessed += self.etlActivity()
-
-        self.runCount += 1
-        # --- END STUFF
-        
-        if self.perfmet:
-            self.perfmet.logJob(recsProcessed)
+        while True:
+            cycleStart = time.monotonic()
+            self.processingDate = date_util.localize(arrow.now().datetime)
+            try:
+                cycleRecs = self.etlActivity()
+            except Exception:
+                if not self.interval:
+                    raise
+                print("ERROR: Exception occurred in cycle %d; continuing with the next cycle:" % self.runCount)
+                traceback.print_exc()
+                cycleRecs = None
+            if cycleRecs is not None:
+                recsProcessed += cycleRecs
+                if self.perfmet and not self.planPath:
+                    self.perfmet.logJob(cycleRecs)
+            objectCache = config.getObjectCache()
+            if objectCache:
+                print("INFO: Object cache: %d hit(s), %d miss(es) so far." % (objectCache.hits, objectCache.misses))
+            if not self.interval or self.planPath:
+                break
+            
+            # Wait for the next cycle:
+            try:
+                time.sleep(max(0, cycleStart + self.interval * 60 - time.monotonic()))
+            except KeyboardInterrupt:
+                print("INFO: Stopping after %d cycle(s)." % self.runCount)
+                break
+            self.runCount += 1
+            self._prepareCycle()
         
         # TODO: Shutdown method call?
         
         return recsProcessed
+    
+    def _prepareCycle(self):
+        """
+        Used by doMainLoop() in daemon mode to get ready for the next cycle. Connections and cached information are kept,
+        and the catalog picks up new entries incrementally.
+        """
+        if self.startDaysBack is not None:
+            self.startDate = _getDaysBack(self.startDaysBack)
+        if self.catalog:
+            self.catalog.refresh()
+        if self.perfmet:
+            self.perfmet.reset()
+    
+    def retrieveUnitData(self):
+        """
+        Returns the latest unit data from the unit data source for this data source (e.g. Knack). In daemon mode, this
+        is reused between cycles for up to UNIT_DATA_MAX_AGE.
+        """
+        now = date_util.getNow()
+        if self.interval and self.unitDataCache and now - self.unitDataCache[1] < UNIT_DATA_MAX_AGE:
+            return self.unitDataCache[0]
+        unitData = config.createUnitDataAccessor(self.dataSource).retrieve()
+        self.unitDataCache = (unitData, now)
+        return unitData
+    
+    def retrieveUnitDataProv(self, storageObject):
+        """
+        Returns a unitdata.UnitDataStorage for the unit data that is kept in the given storage, prepared for the start
+        and end dates. The same one is prepared again in later daemon cycles, so that the unit data that it had
+        retrieved isn't retrieved again.
+        """
+        if storageObject.repository not in self.unitDataProvs:
+            self.unitDataProvs[storageObject.repository] = config.createUnitDataAccessor(storageObject)
+        return self.unitDataProvs[storageObject.repository].prepare(self.startDate, self.endDate)
 
     def etlActivity(self):
         """
@@ -265,25 +385,226 @@ class ETLApp:
         comparator = last_update.LastUpdate(provSrc, provTgt,
                                 force=self.forceOverwrite).configure(startDate=self.startDate,
                                                                      endDate=self.endDate,
-                                                                     baseExtKey=baseExtKey)
+                                                                     baseExtKey=baseExtKey,
+                                                                     streaming=self.streamCompare)
         self.itemCount = 0
         self.prevDate = None
-        for item in comparator.compare(lastRunDate=self.lastRunDate):
-            if item.identifier.date != self.prevDate and self.storageTgt:
-                self.storageTgt.flushCatalog()
-            
+        if self.planPath:
+            return self._doPlan(comparator)
+        if self.interval and provTgt and provTgt.incremental and not self.streamCompare:
+            self._warmCoverage(comparator, provTgt, baseExtKey)
+        runJournal, doneItems = self._openJournal(comparator) if self.checkpoint else (None, set())
+        if self.workers > 1:
+            self._doCompareLoopParallel(comparator, runJournal, doneItems)
+        else:
+            for item in comparator.compare(lastRunDate=self.lastRunDate):
+                if self._isSkipped(item, doneItems):
+                    continue
+                if item.identifier.date != self.prevDate and self.storageTgt:
+                    self.storageTgt.flushCatalog()
+                
+                self.processingDate = date_util.localize(arrow.now().datetime)
+                countIncr = self._runItem(item)
+                if runJournal and self.resumableItems and journal.itemKey(item.identifier) not in self.quarantined:
+                    runJournal.recordDone(journal.itemKey(item.identifier))
+                
+                if countIncr:
+                    if not self.prevDate:
+                        self.prevDate = item.identifier.date
+                self.itemCount += countIncr            
+            else:
+                if self.storageTgt:
+                    self.storageTgt.flushCatalog()
+        if runJournal:
+            self._closeJournal(runJournal)
+        if self.quarantined:
+            print("WARNING: %d item(s) are quarantined." % len(self.quarantined))
+        return self.itemCount
+    
+    def _warmCoverage(self, comparator, provTgt, baseExtKey):
+        """
+        Used by doCompareLoop() in daemon mode. The target coverage from the previous cycle is brought up to date with
+        only the target entries that had been processed since then, rather than querying the whole target again. As an
+        entry's processing date is when its item started rather than when it was committed, the whole target is
+        queried again every COVERAGE_REBUILD_AGE to catch entries that were committed long after that.
+        """
+        key = (provTgt.repository, provTgt.baseFilter, provTgt.extFilter, baseExtKey)
+        earliest = self.startDate or self.lastRunDate
+        syncDate = date_util.getNow()
+        if key in self.coverageCache and syncDate - self.coverageCache[key][2] < COVERAGE_REBUILD_AGE:
+            coverage, prevSyncDate, buildDate = self.coverageCache[key]
+            comparator.updateCoverage(coverage, earliest, prevSyncDate - DAEMON_OVERLAP)
+        else:
+            coverage = comparator.buildCoverage(earliest)
+            buildDate = syncDate
+        self.coverageCache[key] = (coverage, syncDate, buildDate)
+        comparator.coverage = coverage
+    
+    def _doPlan(self, comparator):
+        """
+        Used by doCompareLoop() in planning mode. Runs the comparison and writes out the number of items and the sizes of
+        their source payloads, totaled and also grouped by day, base, and ext, without retrieving any payloads.
+        
+        @return 0, as no items are processed
+        """
+        def tally(group, key, size):
+            entry = group.setdefault(key, {"items": 0, "bytes": 0, "unknown_sizes": 0})
+            entry["items"] += 1
+            if size is None:
+                entry["unknown_sizes"] += 1
+            else:
+                entry["bytes"] += size
+        
+        items = list(comparator.compare(lastRunDate=self.lastRunDate))
+        sizes = comparator.source.getSizes(items)
+        plan = {"data_source": self.dataSource,
+                "start_date": str(self.startDate or self.lastRunDate),
+                "end_date": str(self.endDate) if self.endDate else None,
+                "total": {"items": 0, "bytes": 0, "unknown_sizes": 0},
+                "by_day": {},
+                "by_base": {},
+                "by_ext": {}}
+        for item, size in zip(items, sizes):
+            tally(plan, "total", size)
+            tally(plan["by_day"], item.identifier.date.strftime("%Y-%m-%d"), size)
+            tally(plan["by_base"], item.identifier.base, size)
+            tally(plan["by_ext"], item.identifier.ext, size)
+        
+        if self.planPath == "-":
+            print(json.dumps(plan, indent=2))
+        else:
+            with open(self.planPath, "w") as fileObj:
+                json.dump(plan, fileObj, indent=2)
+            print("INFO: Wrote plan to %s: %d item(s) over %d day(s) totaling %d bytes." % (self.planPath,
+                plan["total"]["items"], len(plan["by_day"]), plan["total"]["bytes"]))
+        return 0
+    
+    def _openJournal(self, comparator):
+        """
+        Used by doCompareLoop() when a checkpoint is specified. Any catalog elements that an interrupted run had left
+        uncommitted are upserted. For resumable items, the target coverage that the interrupted run had compared
+        against is reused, and the set of items that it had completed is returned so they can be skipped. With
+        streaming comparison, no coverage is saved, so that the target is still read alongside the source.
+        
+        @return A tuple of the journal.Journal and the set of completed item keys
+        """
+        runJournal = journal.Journal(self.checkpoint)
+        pending, doneItems = runJournal.load()
+        if not self.resumableItems:
+            doneItems = set()
+        if pending or doneItems:
+            print("INFO: Resuming from checkpoint: %d item(s) done; %d catalog entries to commit." % (len(doneItems), len(pending)))
+        self.catalog.setJournal(runJournal)
+        if pending:
+            for catalogElement in pending:
+                self.catalog.stageUpsert(catalogElement)
+            self.catalog.commitUpsert()
+        
+        if self.resumableItems and comparator.target and comparator.coverage is None and not self.streamCompare:
+            coveragePath = self.checkpoint + ".coverage"
+            if os.path.exists(coveragePath):
+                comparator.coverage = CoverageIndex.load(coveragePath)
+            else:
+                comparator.coverage = comparator.buildCoverage(self.startDate or self.lastRunDate)
+                comparator.coverage.save(coveragePath)
+        return runJournal, doneItems
+    
+    def _closeJournal(self, runJournal):
+        """
+        Used by doCompareLoop() to remove the checkpoint journal after a run has completed.
+        """
+        self.catalog.setJournal(None)
+        runJournal.close(remove=True)
+        coveragePath = self.checkpoint + ".coverage"
+        if os.path.exists(coveragePath):
+            os.remove(coveragePath)
+    
+    def _doCompareLoopParallel(self, comparator, runJournal=None, doneItems=frozenset()):
+        """
+        Used by doCompareLoop() when there are multiple workers. The items for each date are handled concurrently, and
+        the catalog is flushed after each date's items are all finished.
+        """
+        def runDate(executor, items):
+            if not items:
+                return
             self.processingDate = date_util.localize(arrow.now().datetime)
-            countIncr = self.innerLoopActivity(item)
-            
-            if countIncr:
-                if not self.prevDate:
+            futures = [executor.submit(self._runItem, item) for item in items]
+            for item, future in zip(items, futures):
+                countIncr = future.result()
+                if runJournal and self.resumableItems and journal.itemKey(item.identifier) not in self.quarantined:
+                    runJournal.recordDone(journal.itemKey(item.identifier))
+                if countIncr and not self.prevDate:
                     self.prevDate = item.identifier.date
-            self.itemCount += countIncr            
-        else:
+                self.itemCount += countIncr
             if self.storageTgt:
                 self.storageTgt.flushCatalog()
+            
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            items = []
+            for item in comparator.compare(lastRunDate=self.lastRunDate):
+                if self._isSkipped(item, doneItems):
+                    continue
+                if items and item.identifier.date != items[0].identifier.date:
+                    runDate(executor, items)
+                    items = []
+                items.append(item)
+            runDate(executor, items)
         return self.itemCount
         
+    def _isSkipped(self, item, doneItems):
+        """
+        Returns True if the given item had been finished before resuming from a checkpoint, or had been quarantined in
+        an earlier daemon cycle and the quarantine hasn't expired.
+        """
+        if not doneItems and not self.quarantined:
+            return False
+        key = journal.itemKey(item.identifier)
+        if key in doneItems:
+            return True
+        if key in self.quarantined:
+            _, expiry = self.quarantined[key]
+            if expiry is None or date_util.getNow() < expiry:
+                return True
+            del self.quarantined[key]
+        return False
+    
+    def _runItem(self, item):
+        """
+        Calls innerLoopActivity() for the given item. If retries are enabled, transient errors are retried with backoff.
+        An item that still fails is then quarantined: it is reported through perfmet and skipped so that other items
+        can proceed. If the error was transient, the item is tried again in daemon cycles after QUARANTINE_EXPIRY.
+        Applications that don't have resumable items get the retries, but errors are still raised.
+        """
+        attempt = 0
+        while True:
+            try:
+                return self.innerLoopActivity(item)
+            except Exception as exc:
+                if not self.retries:
+                    raise
+                transient = retry.isTransient(exc)
+                if attempt < self.retries and transient:
+                    delay = retry.getBackoff(attempt)
+                    attempt += 1
+                    print("WARNING: Transient error for %s on attempt %d; retrying in %.1f seconds: %s: %s" % (item.label, attempt, delay,
+                                                                                                type(exc).__name__, str(exc)))
+                    time.sleep(delay)
+                    continue
+                if not self.resumableItems:
+                    raise
+                print("ERROR: Quarantining %s after %d attempt(s):" % (item.label, attempt + 1))
+                traceback.print_exc()
+                expiry = date_util.getNow() + QUARANTINE_EXPIRY if transient else None
+                self.quarantined[journal.itemKey(item.identifier)] = (str(exc), expiry)
+                if self.perfmet:
+                    # The same outage may affect the performance metrics database, which mustn't stop the run:
+                    try:
+                        self.perfmet.recordQuarantine(item.identifier.base, item.identifier.ext, item.identifier.date, attempt + 1)
+                    except Exception as perfmetExc:
+                        print("WARNING: Could not record quarantine of %s in performance metrics: %s: %s" % (item.label,
+                            type(perfmetExc).__name__, str(perfmetExc)))
+                return 0
+    
     def innerLoopActivity(self, item):
         """
         This is where the actual ETL activity is called for the given compare item.
@@ -309,4 +630,12 @@ class ETLApp:
                 print("ERROR: Exception occurred in removing temporary directory '%s':" % self.tempDir)
                 exc.print_stack_trace()
             self.tempDir = None
-            
\ No newline at end of file
+            
+
+def _getDaysBack(days):
+    """
+    Returns the localized start of the day that is the given number of days before today.
+    """
+    return date_util.localize(arrow.now()
+        .replace(hour=0, minute=0, second=0, microsecond=0)
+        .shift(days=-days).datetime)
@@ -0,0 +1,93 @@
+"""
+handoff.py: Holds what one stage has written so that a following stage in the same process can read it without
+going back to the storage repository
+
+@author Kenneth Perrine
+"""
+import copy
+import os
+import shutil
+import tempfile
+import threading
+
+class Handoff:
+    """
+    Keeps the files and JSON objects that storage.Storage writes, keyed by repository and path. Storage objects that
+    have a Handoff consult it before retrieving from the repository. Everything is still written to the repository as
+    usual. JSON objects are copied when they are put in and again when they are taken out, so that neither the writer
+    nor the readers can change what the others see.
+    """
+    def __init__(self):
+        """
+        Initializes the object along with a temporary directory for holding files.
+        """
+        self.holdDir = tempfile.mkdtemp()
+        self.files = {}
+        self.fileCount = 0
+        self.jsonObjs = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+
+    def putFile(self, repository, path, sourceFile, move=False):
+        """
+        Keeps a copy of the file that had been written to the given repository and path.
+
+        @param move: Set this to True to move sourceFile into the handoff rather than copying it
+        """
+        with self.lock:
+            self.fileCount += 1
+            holdPath = os.path.join(self.holdDir, str(self.fileCount))
+        if move:
+            shutil.move(sourceFile, holdPath)
+        else:
+            shutil.copyfile(sourceFile, holdPath)
+        with self.lock:
+            self.files[(repository, path)] = holdPath
+
+    def putJSON(self, repository, path, sourceJSON):
+        """
+        Keeps a copy of the JSON object that had been written to the given repository and path.
+        """
+        sourceJSON = copy.deepcopy(sourceJSON)
+        with self.lock:
+            self.jsonObjs[(repository, path)] = sourceJSON
+
+    def getFilePath(self, repository, path):
+        """
+        Returns the path to the local copy of the file written to the given repository and path, or None if there
+        isn't one.
+        """
+        with self.lock:
+            ret = self.files.get((repository, path))
+            if ret:
+                self.hits += 1
+            return ret
+
+    def getJSON(self, repository, path):
+        """
+        Returns a copy of the JSON object that had been written to the given repository and path, or None if there
+        isn't one.
+        """
+        with self.lock:
+            ret = self.jsonObjs.get((repository, path))
+            if ret is not None:
+                self.hits += 1
+        return copy.deepcopy(ret)
+
+    def clear(self):
+        """
+        Discards all that has been kept.
+        """
+        with self.lock:
+            for holdPath in self.files.values():
+                if os.path.exists(holdPath):
+                    os.remove(holdPath)
+            self.files = {}
+            self.jsonObjs = {}
+
+    def close(self):
+        """
+        Discards all that has been kept, and removes the temporary directory.
+        """
+        self.clear()
+        shutil.rmtree(self.holdDir, ignore_errors=True)
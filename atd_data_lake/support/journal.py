@@ -0,0 +1,102 @@
+"""
+journal.py: Append-only checkpoint journal that allows an interrupted ETL run to resume
+
+@author Kenneth Perrine
+"""
+import json
+import os
+import threading
+
+class Journal:
+    """
+    Records, one JSON object per line, the catalog elements that are staged for upsert, the points at which staged
+    elements had been committed to the catalog, and the items that have been completed. Each line is written through
+    to disk as it happens, so the journal stays useful if the process dies at any point.
+    """
+    def __init__(self, path):
+        """
+        Initializes the object.
+
+        @param path: The path of the journal file, which is appended to if it already exists
+        """
+        self.path = path
+        self.fileObj = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        """
+        Reads a journal left over from an earlier run.
+
+        @return A tuple of the list of catalog elements that had been staged but not committed, and a set of the
+            (base, ext, date string) keys of completed items
+        """
+        pending = {}
+        done = set()
+        if os.path.exists(self.path):
+            with open(self.path, "r") as fileObj:
+                for line in fileObj:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # The last line may be incomplete if the process had died while writing it.
+                        continue
+                    if "staged" in record:
+                        element = record["staged"]
+                        pending[(element["repository"], element["data_source"], element["id_base"], element["id_ext"],
+                                 element["collection_date"])] = element
+                    elif "flushed" in record:
+                        pending = {}
+                    elif "done" in record:
+                        done.add(tuple(record["done"]))
+        return list(pending.values()), done
+
+    def _write(self, record, sync=False):
+        """
+        Appends the given record to the journal.
+
+        @param sync: Set this to True to wait until the record is physically written
+        """
+        with self.lock:
+            if not self.fileObj:
+                self.fileObj = open(self.path, "a")
+            self.fileObj.write(json.dumps(record, default=str) + "\n")
+            self.fileObj.flush()
+            if sync:
+                os.fsync(self.fileObj.fileno())
+
+    def recordStaged(self, catalogElement):
+        """
+        Records a catalog element that has been staged for upsert.
+        """
+        self._write({"staged": catalogElement})
+
+    def recordFlushed(self):
+        """
+        Records that all staged catalog elements had been committed to the catalog.
+        """
+        self._write({"flushed": True}, sync=True)
+
+    def recordDone(self, key):
+        """
+        Records that the item with the given key (as from itemKey()) has been completed.
+        """
+        self._write({"done": list(key)}, sync=True)
+
+    def close(self, remove=False):
+        """
+        Closes the journal file.
+
+        @param remove: Set this to True to delete the journal, as when the run had finished successfully
+        """
+        with self.lock:
+            if self.fileObj:
+                self.fileObj.close()
+                self.fileObj = None
+            if remove and os.path.exists(self.path):
+                os.remove(self.path)
+
+def itemKey(identifier):
+    """
+    Returns the journal key for the given last_update.LastUpdate.Identifier.
+    """
+    return identifier.base, identifier.ext, str(identifier.date)
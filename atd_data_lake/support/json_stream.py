@@ -0,0 +1,180 @@
+"""
+json_stream.py: Incremental reading of large JSON documents that consist of sections, such as a header and a list of
+data rows, without holding the whole document in memory
+
+@author Kenneth Perrine
+"""
+import codecs
+import json
+import re
+
+from atd_data_lake.support import compression
+
+"READ_CHUNK_SIZE is the number of bytes that are read from the source at a time."
+READ_CHUNK_SIZE = 1024 * 1024
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+class JSONStreamReader:
+    """
+    Parses a JSON object from a binary file object a piece at a time. The top-level keys are visited in order with
+    iterKeys(). For each key, the value can be read all at once with readValue(), or the items of a list can be read
+    one at a time with iterRows(). Values that aren't read are skipped over.
+    """
+    def __init__(self, fileObj, chunkSize=READ_CHUNK_SIZE):
+        """
+        @param fileObj: A binary file object, or anything with a read(size) method that returns bytes
+        """
+        self.fileObj = fileObj
+        self.chunkSize = chunkSize
+        self.textDecoder = codecs.getincrementaldecoder("utf-8")()
+        self.jsonDecoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.consumed = False
+
+    def _fill(self):
+        """
+        Reads more from the source into the buffer, dropping what had already been parsed. Returns False if the end
+        had already been reached.
+        """
+        if self.eof:
+            return False
+        data = self.fileObj.read(self.chunkSize)
+        if not data:
+            self.eof = True
+        self.buffer = self.buffer[self.pos:] + self.textDecoder.decode(data, final=self.eof)
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        """
+        Skips whitespace and returns the next character, or an empty string at the end.
+        """
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, chars):
+        """
+        Consumes and returns the next character, which must be one of the given characters.
+        """
+        char = self._peek()
+        if not char or char not in chars:
+            raise ValueError("JSON stream: expected one of '%s' but found '%s'" % (chars, char))
+        self.pos += 1
+        return char
+
+    def _value(self):
+        """
+        Parses and returns the next complete JSON value.
+        """
+        self._peek()
+        while True:
+            try:
+                value, end = self.jsonDecoder.raw_decode(self.buffer, self.pos)
+                # A number at the end of the buffer, or one that stops at a "." or exponent because the rest of it
+                # hasn't been read yet, may continue in the next chunk:
+                if self.eof or (end < len(self.buffer)
+                                and not (type(value) in (int, float) and self.buffer[end] in ".eE")):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def iterKeys(self):
+        """
+        Generator that yields each key of the top-level object. Before going on to the next key, the value can be read
+        with readValue() or iterRows(); iterRows() must then be run to completion.
+        """
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            self.consumed = False
+            yield key
+            if not self.consumed:
+                self._skipValue()
+            if self._expect(",}") == "}":
+                return
+
+    def readValue(self):
+        """
+        Returns the whole value for the current key.
+        """
+        self.consumed = True
+        return self._value()
+
+    def iterRows(self):
+        """
+        Generator that yields each item of the list that is the value for the current key.
+        """
+        self.consumed = True
+        self._expect("[")
+        if self._peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self._value()
+            if self._expect(",]") == "]":
+                return
+
+    def _skipValue(self):
+        """
+        Skips over the value for the current key; a list is gone through one item at a time to keep memory use low.
+        """
+        if self._peek() == "[":
+            for _ in self.iterRows():
+                pass
+        else:
+            self.readValue()
+
+def iterRows(source, section="data"):
+    """
+    Generator that yields each item of the list in the given section of a JSON document, which may be compressed.
+
+    @param source: A file path, or a binary file object
+    """
+    fileObj = open(source, "rb") if isinstance(source, str) else source
+    try:
+        reader = JSONStreamReader(compression.openReader(fileObj))
+        for key in reader.iterKeys():
+            if key == section:
+                yield from reader.iterRows()
+                return
+        raise KeyError(section)
+    finally:
+        if fileObj is not source:
+            fileObj.close()
+
+def readSections(source, sections):
+    """
+    Returns a dictionary of the given sections of a JSON document, which may be compressed, that are found. Reading
+    stops as soon as all of them are found, and the sections that come before are skipped without holding them in
+    memory.
+
+    @param source: A file path, or a binary file object
+    """
+    ret = {}
+    sections = set(sections)
+    fileObj = open(source, "rb") if isinstance(source, str) else source
+    try:
+        reader = JSONStreamReader(compression.openReader(fileObj))
+        for key in reader.iterKeys():
+            if key in sections:
+                ret[key] = reader.readValue()
+                if len(ret) == len(sections):
+                    break
+    finally:
+        if fileObj is not source:
+            fileObj.close()
+    return ret
@@ -4,9 +4,13 @@ and target listing objects.
 
 @author Kenneth Perrine
 """
-from collections import namedtuple
+from collections import deque, namedtuple
 import datetime
+import json
+import os
+import tempfile
 
+from atd_data_lake.support.coverage import CoverageIndex
 from atd_data_lake.util import date_util
 
 class LastUpdate:
@@ -33,8 +37,10 @@ class LastUpdate:
         self.endDate = None
         self.baseExtKey = False
         self.baseUnitOpt = True
+        self.coverage = None
+        self.streaming = False
 
-    def configure(self, startDate=None, endDate=None, baseExtKey=False, baseUnitOpt=True):
+    def configure(self, startDate=None, endDate=None, baseExtKey=False, baseUnitOpt=True, coverage=None, streaming=False):
         """
         Configures additional properties and parameters for LastUpdate:
         
@@ -42,38 +48,19 @@ class LastUpdate:
         @param endDate: Upper bound for processing, or None for no upper bound
         @param baseExtKey: Set this to true to compare the presence of both base and ext; otherwise, just base is used.
         @param baseUnitOpt: If baseExtKey is False, then if True, prevent tracking of entries that have unit_data.* or site.* extensions.  
+        @param coverage: An optional coverage.CoverageIndex of the target, keyed the same as baseExtKey implies, that is
+            used instead of querying the target (e.g. one that had been loaded from a file)
+        @param streaming: Set this to True to read the target alongside the source rather than all at first. This uses
+            memory only for the targets near the current source date, but requires sources to be given in date order.
         """
         self.startDate = startDate
         self.endDate = endDate
         self.baseExtKey = baseExtKey
         self.baseUnitOpt = baseUnitOpt
+        self.coverage = coverage
+        self.streaming = streaming
         return self
 
-    class _CompareTarget:
-        """
-        Used in compare() to keep track of targets
-        """
-        def __init__(self):
-            self.items = []
-            self.curIndex = 0
-            
-        def advanceDate(self, cmpDate):
-            "Moves the index up to the given date."
-            while self.curIndex < len(self.items) and self.items[self.curIndex].date < cmpDate:
-                self.curIndex += 1
-                
-        def isWithin(self, cmpDate, cmpDateEnd):
-            "Checks to see if the given date range overlaps the current position."
-            if self.curIndex < len(self.items):
-                endDate = self.items[self.curIndex].dateEnd
-                if not cmpDateEnd:
-                    cmpDateEnd = date_util.localize(cmpDate.replace(tzinfo=None) + datetime.timedelta(days=1))
-                if not endDate:
-                    endDate = date_util.localize(self.items[self.curIndex].date.replace(tzinfo=None) + datetime.timedelta(days=1))
-                if not (cmpDateEnd <= self.items[self.curIndex].date or cmpDate >= endDate):
-                    return True
-            return False
-        
     Identifier = namedtuple("Identifier", "base ext date")
         
     def compare(self, lastRunDate=None):
@@ -87,27 +74,16 @@ class LastUpdate:
         if not earliest:
             earliest = lastRunDate
         self.source.prepare(earliest, self.endDate)
-        compareTargets = {}
-        if self.target:
-            self.target.prepare(earliest, self.endDate)
-            for target in self.target.runQuery():
-                if not self.baseExtKey and self.baseUnitOpt:
-                    if target.ext.lower().startswith("unit_data.") or target.ext.lower().startswith("site."):
-                        # TODO: This is a quick fix. Consider more robust fixes for this.
-                        continue
-                key = (target.base, target.ext) if self.baseExtKey else target.base
-                if key not in compareTargets:
-                    compareTargets[key] = self._CompareTarget()
-                compareTargets[key].items.append(target)
+        coverage = self.coverage
+        if coverage is None and self.target:
+            coverage = self._StreamingCoverage(self._runTargetQuery(earliest)) if self.streaming else self.buildCoverage(earliest)
         forceRec = set()
         for sourceItem in self.source.runQuery():
             skipFlag = False
             key = (sourceItem.base, sourceItem.ext) if self.baseExtKey else sourceItem.base
-            if key in compareTargets:
-                compareTarget = compareTargets[key]
-                compareTarget.advanceDate(sourceItem.date)
-                if compareTarget.isWithin(sourceItem.date, sourceItem.dateEnd):
-                    skipFlag = True
+            # A source item is already covered if a target item starts within the source item's time range:
+            if coverage is not None and coverage.covers(key, sourceItem.date, sourceItem.dateEnd):
+                skipFlag = True
             if self.force and skipFlag:
                 forceStr = "INFO: Forcing processing of %s for date %s." % (str(key), sourceItem.date)
                 if forceStr not in forceRec:
@@ -120,6 +96,88 @@ class LastUpdate:
                                       provItem=sourceItem,
                                       label=sourceItem.label)
     
+    def buildCoverage(self, earliest=None):
+        """
+        Queries the target from the given earliest date to the end date, and returns a coverage.CoverageIndex of it
+        that compare() uses. This can be saved and passed in through configure() for later runs.
+        """
+        ret = CoverageIndex()
+        for key, date in self._runTargetQuery(earliest):
+            ret.add(key, date)
+        return ret
+    
+    def updateCoverage(self, coverage, earliest, processedSince):
+        """
+        Adds the target items that had been processed since the given date to a coverage.CoverageIndex that had been
+        returned from buildCoverage(). The target provider must be incremental.
+        """
+        self.target.processedSince = processedSince
+        try:
+            for key, date in self._runTargetQuery(earliest):
+                coverage.add(key, date)
+        finally:
+            self.target.processedSince = None
+        return coverage
+    
+    def _runTargetQuery(self, earliest):
+        """
+        Queries the target from the given earliest date to the end date, and yields the key and date of each target item.
+        """
+        self.target.prepare(earliest, self.endDate)
+        for target in self.target.runQuery():
+            if not self.baseExtKey and self.baseUnitOpt:
+                if target.ext.lower().startswith("unit_data.") or target.ext.lower().startswith("site."):
+                    # TODO: This is a quick fix. Consider more robust fixes for this.
+                    continue
+            yield (target.base, target.ext) if self.baseExtKey else target.base, target.date
+    
+    class _StreamingCoverage:
+        """
+        Used in compare() in streaming mode in place of a coverage.CoverageIndex. Target items are read as the source
+        dates advance, and only those that start at or after the current source date are kept.
+        """
+        def __init__(self, targetQuery):
+            """
+            Initializes the object.
+            
+            @param targetQuery: Generator of (key, date) for target items, in date order
+            """
+            self.targetQuery = targetQuery
+            self.pending = None
+            self.started = False
+            self.window = deque() # Target (key, date) in date order
+            self.keyDates = {} # key -> deque of target dates in date order
+            self.lastDate = None
+        
+        def covers(self, key, date, dateEnd=None):
+            "Returns True if a target item for the given key starts on or after date and before dateEnd."
+            date = date_util.localize(date)
+            if dateEnd:
+                dateEnd = date_util.localize(dateEnd)
+            else:
+                dateEnd = date_util.localize(date.replace(tzinfo=None) + datetime.timedelta(days=1))
+            if self.lastDate and date < self.lastDate:
+                raise ValueError("Streaming comparison requires source items in date order; %s follows %s." % (str(date), str(self.lastDate)))
+            self.lastDate = date
+            
+            # Take in the targets that start before the end of this range:
+            if not self.started:
+                self.pending = next(self.targetQuery, None)
+                self.started = True
+            while self.pending and self.pending[1] < dateEnd:
+                self.window.append(self.pending)
+                self.keyDates.setdefault(self.pending[0], deque()).append(self.pending[1])
+                self.pending = next(self.targetQuery, None)
+                
+            # Let go of the targets that start before this range, as later sources won't need them:
+            while self.window and self.window[0][1] < date:
+                oldKey = self.window.popleft()[0]
+                self.keyDates[oldKey].popleft()
+                if not self.keyDates[oldKey]:
+                    del self.keyDates[oldKey]
+            dates = self.keyDates.get(key)
+            return bool(dates) and dates[0] < dateEnd
+    
     class _LastUpdateItem:
         """
         Returned from LastUpdate.compare(). Identifies items that need updating.
@@ -152,6 +210,9 @@ class LastUpdProv:
     """
     Base class for provision of last-update information
     """
+    "incremental: True for providers whose runQuery() can be limited to items processed since processedSince."
+    incremental = False
+    
     def __init__(self, sameDay=False):
         """
         Base constructor.
@@ -160,6 +221,7 @@ class LastUpdProv:
         """
         self.startDate = None
         self.endDate = None
+        self.processedSince = None
         self.sameDayDate = date_util.localize(datetime.datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0) \
                         if not sameDay else None
     
@@ -193,6 +255,13 @@ class LastUpdProv:
         @param lastUpdItem: A _LastUpdateItem that contains a ".provItem.payload" attribute
         """
         return lastUpdItem.provItem.payload
+    
+    def getSizes(self, lastUpdItems):
+        """
+        Returns a list of the sizes in bytes of the payloads behind the given _LastUpdateItem objects, found without
+        retrieving the payloads. A size is None where it can't be determined.
+        """
+        return [None] * len(lastUpdItems)
         
     "_LastUpdProvItem represents a result from a LastUpdProvider object."
     _LastUpdProvItem = namedtuple("_LastUpdProvItem", "base ext date dateEnd payload label")
@@ -209,6 +278,8 @@ class LastUpdCatProv(LastUpdProv):
     """
     Represents a Catalog, as a LastUpdate source or target.
     """
+    incremental = True
+    
     def __init__(self, catalog, repository, baseFilter=None, extFilter=None, sameDay=False):
         """
         Initializes the object
@@ -231,7 +302,7 @@ class LastUpdCatProv(LastUpdProv):
         if self.startDate == self.endDate:
             lateDate = None
         for result in self.catalog.query(self.repository, self.baseFilter, self.extFilter, self.startDate, lateDate,
-                                         exactEarlyDate=(self.startDate == self.endDate)):
+                                         exactEarlyDate=(self.startDate == self.endDate), processedSince=self.processedSince):
             base, ext, date = self._getIdentifier(result["id_base"], result["id_ext"], result["collection_date"])
             if self._isSameDayCancel(date):
                 continue
@@ -251,6 +322,122 @@ class LastUpdStorageCatProv(LastUpdCatProv):
         Initializes the object
         """
         super().__init__(storage.catalog, storage.repository, baseFilter, extFilter)
+        self.storage = storage
 
-# TODO: It would also be possible to create a provider that generates dates at specified intervals
-# for querying a data source that doesn't easily provide its date coverage.
+    def getSizes(self, lastUpdItems):
+        """
+        Returns a list of the sizes in bytes of the stored files behind the given _LastUpdateItem objects.
+        """
+        sizes = self.storage.getSizes([item.provItem.label for item in lastUpdItems])
+        return [sizes.get(item.provItem.label) for item in lastUpdItems]
+
+"PROBE_NEGATIVE_GRACE: How long after a window ends that finding no data there is cached, as late rows may still arrive before then"
+PROBE_NEGATIVE_GRACE = datetime.timedelta(days=7)
+
+class IntervalLastUpdProv(LastUpdProv):
+    """
+    Represents a data source that can't cheaply list its own date coverage. Candidate windows at regular intervals are
+    generated between the start and end dates, and each is probed for the existence of data as runQuery() reaches it.
+    Probe results can be cached in a local file so that later runs don't need to probe the same windows again.
+    Override _probe() to implement the check.
+    """
+    def __init__(self, baseName, extName, interval=datetime.timedelta(days=1), probeCache=None, sameDay=False,
+                 negativeGrace=PROBE_NEGATIVE_GRACE):
+        """
+        Initializes the object
+        
+        @param baseName: The "base name" that shows up in the identifier object given back by runQuery()
+        @param extName: The "ext name" that shows up in the identifier object given back by runQuery()
+        @param interval: A datetime.timedelta for the window length; windows of one day or longer begin at midnight
+        @param probeCache: The path to a JSON file that retains probe results between runs, or None to not cache
+        @param sameDay: If False and no endDate is specified, then filter out results that occur "today"
+        @param negativeGrace: A datetime.timedelta for how long after a window ends that finding no data is cached
+        """
+        super().__init__(sameDay=sameDay)
+        self.baseName = baseName
+        self.extName = extName
+        self.interval = interval
+        self.probeCache = probeCache
+        self.negativeGrace = negativeGrace
+        self.probeResults = {}
+        self.probeChanged = False
+        if self.probeCache and os.path.isfile(self.probeCache):
+            with open(self.probeCache, "r") as fileObj:
+                self.probeResults = json.load(fileObj)
+    
+    def _probe(self, date, dateEnd):
+        """
+        Override this to return True if the data source has any data on or after date and before dateEnd.
+        """
+        raise NotImplementedError
+    
+    def _makeLabel(self, date):
+        """
+        Returns the label for the window that starts at the given date.
+        """
+        dateFormat = "%Y-%m-%d" if self.interval >= datetime.timedelta(days=1) else "%Y-%m-%d_%H%M"
+        return self.baseName + "_" + date.strftime(dateFormat) + "." + self.extName
+    
+    def _getWindows(self):
+        """
+        Generates the (date, dateEnd) windows that lie between the start and end dates.
+        """
+        if not self.startDate:
+            raise ValueError("IntervalLastUpdProv requires a start date.")
+        if self.startDate == self.endDate:
+            yield self.startDate, date_util.localize(self.startDate.replace(tzinfo=None) + self.interval)
+            return
+        date = self.startDate.replace(tzinfo=None)
+        if self.interval >= datetime.timedelta(days=1):
+            date = date.replace(hour=0, minute=0, second=0, microsecond=0)
+        endDate = (self.endDate or date_util.getNow()).replace(tzinfo=None)
+        while date < endDate:
+            dateEnd = date + self.interval
+            yield date_util.localize(date), date_util.localize(dateEnd)
+            date = dateEnd
+    
+    def runQuery(self):
+        """
+        Probes each window in turn and provides those that have data as a generator of _LastUpdProvItem.
+        """
+        # Windows that end before this time are considered settled, so that finding no data there is also cached. Until
+        # then, rows that arrive late may still show up:
+        settledDate = date_util.getNow() - self.negativeGrace
+        try:
+            for date, dateEnd in self._getWindows():
+                if self._isSameDayCancel(date):
+                    continue
+                key = date.isoformat() + "/" + dateEnd.isoformat()
+                found = self.probeResults.get(key)
+                if found is None:
+                    found = self._probe(date, dateEnd)
+                    if found or dateEnd <= settledDate:
+                        self.probeResults[key] = found
+                        self.probeChanged = True
+                if found:
+                    base, ext, date = self._getIdentifier(self.baseName, self.extName, date)
+                    yield LastUpdProv._LastUpdProvItem(base=base,
+                                                       ext=ext,
+                                                       date=date,
+                                                       dateEnd=dateEnd,
+                                                       payload=None,
+                                                       label=self._makeLabel(date))
+        finally:
+            if self.probeCache and self.probeChanged:
+                self._writeProbeCache()
+    
+    def _writeProbeCache(self):
+        """
+        Writes the probe results to the cache file. A temporary file is written first and then moved into place, so
+        that the cache file is never left partly written.
+        """
+        fileHandle, tempPath = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(os.path.abspath(self.probeCache)))
+        try:
+            with os.fdopen(fileHandle, "w") as fileObj:
+                json.dump(self.probeResults, fileObj)
+            os.replace(tempPath, self.probeCache)
+        except BaseException:
+            if os.path.exists(tempPath):
+                os.remove(tempPath)
+            raise
+        self.probeChanged = False
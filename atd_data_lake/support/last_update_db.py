@@ -3,7 +3,8 @@ last_update_db.py: Support for LastUpdate from a database. Associated database o
 
 @author Kenneth Perrine
 """
-import collections
+import collections.abc
+import datetime
 
 from atd_data_lake.support import last_update
 
@@ -55,6 +56,45 @@ class LastUpdDB(last_update.LastUpdProv):
         @param lastUpdItem: A _LastUpdateItem that contains a date
         """
         ret = self.dbObject.retrieve(earlyDate=lastUpdItem.identifier.date, lateDate=lastUpdItem.identifier.date)
-        if isinstance(ret, collections.Mapping):
+        if isinstance(ret, collections.abc.Mapping):
             ret = ret[lastUpdItem.identifier.date]
         return ret
+
+class LastUpdDBInterval(last_update.IntervalLastUpdProv):
+    """
+    Represents a database whose coverage is found by probing one window at a time, rather than by aggregating over
+    the whole table as LastUpdDB does. The associated database object must have "probe()" and "retrieve()" methods.
+    """
+    def __init__(self, dbObject, baseName, extName="csv", interval=datetime.timedelta(days=1), probeCache=None, sameDay=False,
+                 negativeGrace=last_update.PROBE_NEGATIVE_GRACE):
+        """
+        Initializes the object
+
+        @param dbObject: Must contain a "probe(earlyDate, lateDate)" method that returns True if records exist
+        @param baseName: The "base name" that shows up in the identifier object given back by runQuery()
+        @param extName: The "ext name" that shows up in the identifier object given back by runQuery()
+        @param interval: A datetime.timedelta for the length of each probed window
+        @param probeCache: The path to a JSON file that retains probe results between runs, or None to not cache
+        @param sameDay: If False and no endDate is specified, then filter out results that occur "today"
+        @param negativeGrace: A datetime.timedelta for how long after a window ends that finding no data is cached
+        """
+        super().__init__(baseName, extName, interval=interval, probeCache=probeCache, sameDay=sameDay,
+                         negativeGrace=negativeGrace)
+        self.dbObject = dbObject
+    
+    def _probe(self, date, dateEnd):
+        """
+        Returns True if the database has any records on or after date and before dateEnd.
+        """
+        return self.dbObject.probe(date, dateEnd)
+
+    def resolvePayload(self, lastUpdItem):
+        """
+        Gets the records for the window of the corresponding lastUpdItem from the database.
+        
+        @param lastUpdItem: A _LastUpdateItem that contains a date
+        """
+        ret = self.dbObject.retrieve(earlyDate=lastUpdItem.identifier.date, lateDate=lastUpdItem.provItem.dateEnd)
+        if isinstance(ret, collections.abc.Mapping):
+            ret = [rec for date in sorted(ret) for rec in ret[date]]
+        return ret
@@ -0,0 +1,155 @@
+"""
+object_cache.py: Local on-disk cache of storage objects that are retrieved again and again, such as unit data and
+site files
+
+@author Kenneth Perrine
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+"STALE_TEMP_SECONDS is the age after which a partial download left behind by a process that had died is removed."
+STALE_TEMP_SECONDS = 24 * 60 * 60
+
+"EVICT_TO_FRACTION is the fraction of the byte limit that eviction brings the cache down to, so that it isn't needed again right away."
+EVICT_TO_FRACTION = 0.9
+
+class ObjectCache:
+    """
+    Keeps copies of storage objects in a directory, keyed by repository and path. Each copy is also named by the
+    object's validator (e.g. ETag and size), so a copy is only used if the object hasn't changed since. The copies of
+    each object are kept in their own subdirectory. When the copies take up more than the byte limit, the ones that
+    were least recently used are removed. Several processes may share the same directory.
+    """
+    def __init__(self, cacheDir, maxBytes, maxObjectBytes=None):
+        """
+        Initializes the object.
+
+        @param cacheDir: The directory that holds the cached copies
+        @param maxBytes: The total size that the cached copies are kept within
+        @param maxObjectBytes: Objects larger than this aren't cached, or None for no limit other than maxBytes
+        """
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.maxObjectBytes = maxObjectBytes if maxObjectBytes is not None else maxBytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cacheDir, exist_ok=True)
+        self.totalBytes = sum(size for _, size, _ in self._scan())
+
+    def getFilePath(self, repository, path, storageConn):
+        """
+        Returns the path to an up-to-date cached copy of the object at the given repository and path, retrieving it
+        with storageConn (a storage.StorageImpl) if needed. Returns None if the object isn't to be cached, in which
+        case the caller should retrieve it directly. The returned file must not be modified.
+        """
+        validator = storageConn.getValidator(path)
+        if not validator:
+            return None
+        etag, size = validator
+        keyDir = os.path.join(self.cacheDir, _hashStr(repository + "\n" + path))
+        cachePath = os.path.join(keyDir, _hashStr("%s\n%d" % (etag, size)))
+        if os.path.exists(cachePath):
+            try:
+                os.utime(cachePath) # Marks it as recently used.
+                with self.lock:
+                    self.hits += 1
+                return cachePath
+            except FileNotFoundError:
+                pass # Another process has just evicted it.
+        if size > self.maxObjectBytes:
+            return None
+
+        # Download to a temporary file and then put it in place, so that other processes never see a partial copy:
+        with self.lock:
+            self.misses += 1
+        fileHandle, tempPath = tempfile.mkstemp(suffix=".tmp", dir=self.cacheDir)
+        os.close(fileHandle)
+        try:
+            storageConn.retrieveFilePath(path, destPath=tempPath)
+            while True:
+                os.makedirs(keyDir, exist_ok=True)
+                try:
+                    os.replace(tempPath, cachePath)
+                    break
+                except FileNotFoundError:
+                    if not os.path.exists(tempPath):
+                        raise
+                    # Another process had just removed the empty subdirectory; make it again.
+        except BaseException:
+            if os.path.exists(tempPath):
+                os.remove(tempPath)
+            raise
+
+        # Older copies of the same object are now out of date:
+        addedBytes = os.path.getsize(cachePath)
+        for entry in os.scandir(keyDir):
+            if entry.path != cachePath:
+                try:
+                    entrySize = entry.stat().st_size
+                except FileNotFoundError:
+                    continue
+                if self._remove(entry.path):
+                    addedBytes -= entrySize
+        with self.lock:
+            self.totalBytes += addedBytes
+            if self.totalBytes > self.maxBytes:
+                self._evict()
+        return cachePath
+
+    def _scan(self):
+        """
+        Returns a list of (path, size, last used time) for the cached copies, removing stale partial downloads.
+        """
+        ret = []
+        now = time.time()
+        for entry in os.scandir(self.cacheDir):
+            try:
+                if entry.is_dir():
+                    for subEntry in os.scandir(entry.path):
+                        try:
+                            stat = subEntry.stat()
+                        except FileNotFoundError:
+                            continue
+                        ret.append((subEntry.path, stat.st_size, stat.st_mtime))
+                elif entry.name.endswith(".tmp") and now - entry.stat().st_mtime > STALE_TEMP_SECONDS:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+        return ret
+
+    def _evict(self):
+        """
+        Removes the least recently used copies until the total size is within EVICT_TO_FRACTION of the limit. The
+        directory is looked at again, as other processes may have added to it.
+        """
+        entries = sorted(self._scan(), key=lambda entry: entry[2])
+        self.totalBytes = sum(entry[1] for entry in entries)
+        for entryPath, size, _ in entries:
+            if self.totalBytes <= self.maxBytes * EVICT_TO_FRACTION:
+                break
+            if self._remove(entryPath):
+                self.totalBytes -= size
+                try:
+                    os.rmdir(os.path.dirname(entryPath))
+                except OSError:
+                    pass # Other copies of the object are still there.
+
+    def _remove(self, path):
+        """
+        Removes a cached copy, returning False if it was already gone.
+        """
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+def _hashStr(text):
+    """
+    Returns a short hexadecimal hash of the given string that's usable in a filename.
+    """
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:20]
@@ -5,11 +5,126 @@ perfmet.py: Performance metrics support module for COA ATD Data Lake
 """
 import collections
 import datetime
+import functools
+import threading
+import time
 
 from atd_data_lake.util import date_util
 
 SensorObs = collections.namedtuple("SensorObs", "observation expected collectionDate minTimestamp maxTimestamp")
 
+"_spans maps each phase name to the list [count, total seconds, maximum seconds, bytes] accumulated by Span objects."
+_spans = {}
+_spansLock = threading.Lock()
+
+class Span:
+    """
+    Times a phase of processing, such as a download or a transform, and adds it to the totals for that phase name.
+    Use it as a context manager:
+    
+        with perfmet.span("download") as sp:
+            ...
+            sp.addBytes(size)
+    
+    Spans may be nested and may run in several threads at once, so totals for different phases can overlap and add up
+    to more than the job time.
+    """
+    def __init__(self, name, nBytes=0):
+        """
+        @param name: The phase name
+        @param nBytes: The number of bytes handled, if known ahead of time
+        """
+        self.name = name
+        self.nBytes = nBytes
+        self.startTime = None
+        
+    def addBytes(self, nBytes):
+        """
+        Adds to the number of bytes handled in this phase.
+        """
+        if nBytes:
+            self.nBytes += nBytes
+        
+    def __enter__(self):
+        self.startTime = time.perf_counter()
+        return self
+    
+    def __exit__(self, excType, excValue, tb):
+        self.record(time.perf_counter() - self.startTime)
+        return False
+    
+    def record(self, elapsed):
+        """
+        Adds the given number of seconds and the bytes handled to the totals for this phase.
+        """
+        with _spansLock:
+            stats = _spans.get(self.name)
+            if not stats:
+                stats = _spans[self.name] = [0, 0.0, 0.0, 0]
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+            stats[3] += self.nBytes
+
+def span(name, nBytes=0):
+    """
+    Returns a new Span for timing the given phase name, for use in a "with" statement.
+    """
+    return Span(name, nBytes)
+
+def timed(name):
+    """
+    Decorator that times each call of the decorated function as the given phase name, as with span().
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def timedIter(name, iterable):
+    """
+    Generator that passes along the items of the given iterable, and records the time spent producing them, such as
+    rows that are transformed as they are read, as one span of the given phase name.
+    """
+    sp = Span(name)
+    iterator = iter(iterable)
+    elapsed = 0.0
+    try:
+        while True:
+            startTime = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                elapsed += time.perf_counter() - startTime
+            yield item
+    finally:
+        sp.record(elapsed)
+
+def getSpans(reset=False):
+    """
+    Returns a dictionary of phase names to dictionaries of "count", "seconds", "max_seconds", and "bytes".
+    
+    @param reset: Set this to True to clear out the totals afterward
+    """
+    with _spansLock:
+        ret = {name: {"count": stats[0], "seconds": round(stats[1], 3), "max_seconds": round(stats[2], 3), "bytes": stats[3]}
+               for name, stats in _spans.items()}
+        if reset:
+            _spans.clear()
+    return ret
+
+def resetSpans():
+    """
+    Clears out the totals for all phases.
+    """
+    with _spansLock:
+        _spans.clear()
+
 class PerfMet:
     """
     PerfMet class handles the collection and recording of performance metrics.
@@ -27,6 +142,23 @@ class PerfMet:
         self.collectTimeStart = None
         self.collectTimeEnd = None
         self.observations = {} # (sensorName, dataType) -> observation
+        self.spans = {} # Phase name -> totals, as from getSpans()
+        self.lock = threading.Lock()
+        resetSpans()
+        
+    def reset(self):
+        """
+        Starts a new job with the same connection, as for each cycle of an ETL process that runs continuously.
+        """
+        with self.lock:
+            self.processingTime = date_util.getNow()
+            self.processingTotal = None
+            self.records = None
+            self.collectTimeStart = None
+            self.collectTimeEnd = None
+            self.observations = {}
+            self.spans = {}
+        resetSpans()
         
     def logJob(self, records):
         """
@@ -35,6 +167,10 @@ class PerfMet:
         # TODO: There could be opportunity to do status updates that can be read by other processes.
         self.processingTotal = (date_util.getNow() - self.processingTime).total_seconds()
         self.records = records
+        self.spans = getSpans()
+        for name, stats in sorted(self.spans.items(), key=lambda item: -item[1]["seconds"]):
+            print("INFO: Phase '%s': %d time(s), %.3f sec. total, %.3f sec. max, %d bytes" \
+                  % (name, stats["count"], stats["seconds"], stats["max_seconds"], stats["bytes"]))
         self.dbConn.writeJob(self)
         
     def recordCollect(self, timestampIn, representsDay=False):
@@ -42,23 +178,36 @@ class PerfMet:
         Tracks the maximum and minimum timestamps. Note that this performs comparisons without localization.
         """
         timestampEnd = date_util.localize(timestampIn.replace(tzinfo=None) + datetime.timedelta(days=1)) if representsDay else timestampIn
-        if not self.collectTimeStart:
-            self.collectTimeStart = timestampIn
-        if not self.collectTimeEnd:
-            self.collectTimeEnd = timestampEnd
-        self.collectTimeStart = min(self.collectTimeStart, timestampIn)
-        self.collectTimeEnd = max(self.collectTimeEnd, timestampEnd)
+        with self.lock:
+            if not self.collectTimeStart:
+                self.collectTimeStart = timestampIn
+            if not self.collectTimeEnd:
+                self.collectTimeEnd = timestampEnd
+            self.collectTimeStart = min(self.collectTimeStart, timestampIn)
+            self.collectTimeEnd = max(self.collectTimeEnd, timestampEnd)
     
     def recordSensorObs(self, sensorName, dataType, observation):
         """
         Records an observation. Pass in a SensorObs object.
         """
-        self.observations[(sensorName, dataType)] = observation
+        with self.lock:
+            self.observations[(sensorName, dataType)] = observation
+        
+    def recordQuarantine(self, sensorName, dataType, collectionDate, attempts):
+        """
+        Writes an observation right away that the item for the given sensor, data type, and collection date had been
+        set aside after failing the given number of attempts. The data type is recorded as "Quarantined" followed by
+        the given data type.
+        """
+        obs = SensorObs(observation=attempts, expected=0, collectionDate=collectionDate, minTimestamp=None, maxTimestamp=None)
+        with self.lock:
+            self.dbConn.writeObs(self, {(sensorName, "Quarantined " + dataType): obs})
         
     def writeSensorObs(self):
         """
         Writes sensor observations to the database. Then clears out the cache.
         """
-        self.dbConn.writeObs(self)
-        self.observations = {}
+        with self.lock:
+            self.dbConn.writeObs(self)
+            self.observations = {}
         
\ No newline at end of file
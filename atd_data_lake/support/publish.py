@@ -5,6 +5,8 @@ publish.py coordinates the publishing of data, and noting the publishing in the
 """
 import csv, os
 
+from atd_data_lake.support import perfmet
+
 class Publisher:
     """
     Coordinates the publishing of data and recording in the catalog.
@@ -48,7 +50,8 @@ class Publisher:
         if not self.simulationMode:
             if self.chunkSize and self.chunkSize > 1:
                 print("INFO: (At Row %d) writing %d rows." % (self.rowCounterPreFlush, len(self.buffer)))
-            self.connector.write(self.buffer)
+            with perfmet.span("publish"):
+                self.connector.write(self.buffer)
         else:
             if self.chunkSize and self.chunkSize > 1:
                 print("INFO: (At Row %d) would have written %d rows." % (self.rowCounterPreFlush, len(self.buffer)))
@@ -0,0 +1,53 @@
+"""
+retry.py: Classification of errors as transient or permanent, and backoff delays for retrying
+
+@author Kenneth Perrine
+"""
+import random
+
+import requests
+
+"RETRY_BASE_DELAY is the number of seconds that the backoff delay is scaled from for the first retry."
+RETRY_BASE_DELAY = 2.0
+
+"RETRY_MAX_DELAY is the most number of seconds that a backoff delay can be."
+RETRY_MAX_DELAY = 120.0
+
+"TRANSIENT_HTTP_STATUSES are HTTP status codes for conditions that may clear up on their own."
+TRANSIENT_HTTP_STATUSES = {408, 429, 500, 502, 503, 504}
+
+"TRANSIENT_AWS_CODES are AWS error codes for conditions that may clear up on their own."
+TRANSIENT_AWS_CODES = {"RequestTimeout", "RequestTimeTooSkewed", "SlowDown", "Throttling", "ThrottlingException",
+                       "InternalError", "ServiceUnavailable"}
+
+"TRANSIENT_ERROR_NAMES are names of exception classes from libraries like botocore that indicate network trouble."
+TRANSIENT_ERROR_NAMES = {"EndpointConnectionError", "ConnectTimeoutError", "ReadTimeoutError", "ConnectionClosedError",
+                         "IncompleteReadError"}
+
+def isTransient(exc):
+    """
+    Returns True if the given exception comes from a condition that may clear up if the operation is tried again,
+    such as a dropped connection, a timeout, throttling, or a server error. Other errors, like bad data, are permanent.
+    """
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    if isinstance(exc, requests.exceptions.RequestException):
+        if isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                            requests.exceptions.ChunkedEncodingError)):
+            return True
+        return exc.response is not None and exc.response.status_code in TRANSIENT_HTTP_STATUSES
+
+    # botocore isn't imported here; its errors are recognized by their class names and their responses:
+    response = getattr(exc, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code") in TRANSIENT_AWS_CODES \
+            or response.get("ResponseMetadata", {}).get("HTTPStatusCode") in TRANSIENT_HTTP_STATUSES
+    return type(exc).__name__ in TRANSIENT_ERROR_NAMES
+
+def getBackoff(attempt, baseDelay=RETRY_BASE_DELAY, maxDelay=RETRY_MAX_DELAY):
+    """
+    Returns the number of seconds to wait before the retry that follows the given attempt number (starting at 0). The
+    upper bound doubles with each attempt, and the delay is randomly chosen below that so that many workers that
+    failed together don't all retry together.
+    """
+    return random.uniform(0, min(maxDelay, baseDelay * 2 ** attempt))
@@ -5,17 +5,26 @@ Kenneth Perrine
 Center for Transportation Research, The University of Texas at Austin
 """
 import tempfile
+from contextlib import closing
+import io
 import json
 
 import os
+import shutil
 import arrow
 
+from atd_data_lake.support import compression, json_stream, perfmet
+
+"JSON_CONTENT_TYPE is the MIME type that JSON resources are labeled with."
+JSON_CONTENT_TYPE = "application/json"
+
 class Storage:
     """
     Facilitates the storage or retrieval of files within a cloud service or local volume
     """
     
-    def __init__(self, storageConn, repository, dataSource, catalogResource=None, tempDir=None, simulationMode=False, writeFilePath=None):
+    def __init__(self, storageConn, repository, dataSource, catalogResource=None, tempDir=None, simulationMode=False, writeFilePath=None,
+                 handoff=None, objectCache=None, encoding=None):
         """
         Initializes storage connection using the application object
         
@@ -26,6 +35,9 @@ class Storage:
         @param tempDir: An already-established temporary directory
         @param simulationMode: If True, prevents writing of files to storage obects or catalog
         @param writeFilePath: If not None, causes a file to be written in the given path when storage is attempted
+        @param handoff: An optional handoff.Handoff that keeps what is written and is consulted first for retrievals
+        @param objectCache: An optional object_cache.ObjectCache that keeps local copies of what is retrieved with cache=True
+        @param encoding: The compression that JSON is written with ("gzip" or "zstd"), or None to not compress
         """
         self.storageConn = storageConn
         self.repository = repository
@@ -34,6 +46,10 @@ class Storage:
         self.tempDir = tempDir
         self.simulationMode = simulationMode
         self.writeFilePath = writeFilePath
+        self.handoff = handoff
+        self.objectCache = objectCache
+        compression.checkEncoding(encoding)
+        self.encoding = encoding
     
     def makeFilename(self, base, ext, collectionDate):
         """
@@ -55,7 +71,7 @@ class Storage:
             filenamePart = self.makeFilename(base, ext, collectionDate) 
         return self.storageConn.makePath(self.dataSource, collectionDate, filenamePart)
     
-    def retrieveFilePath(self, path, destPath=None, deriveFilename=False):
+    def retrieveFilePath(self, path, destPath=None, deriveFilename=False, cache=False):
         """
         retrieveFilePath(path) retrieves a resource at the given storage platform-specific path (presumably retrieved from the
         catalog) and returns a full path to the written file.
@@ -63,29 +79,123 @@ class Storage:
         @param path: The complete target platform-dependent path including the desired filename
         @param destPath: The path to write the file to; set this to null in order to write the file to the temp directory
         @param deriveFilename: Set this to false if the filename is already bundled in the destPath
+        @param cache: Set this to True to go through the object cache, for resources that are retrieved again and again
         """
         if not destPath:
             destPath = self.tempDir
             deriveFilename = True
-        return self.storageConn.retrieveFilePath(path, destPath=destPath, deriveFilename=deriveFilename)
+        if self.handoff:
+            holdPath = self.handoff.getFilePath(self.repository, path)
+            if holdPath:
+                if deriveFilename:
+                    destPath = os.path.join(destPath, self.storageConn.extractFilename(path))
+                shutil.copyfile(holdPath, destPath)
+                return destPath
+        with perfmet.span("download") as sp:
+            cachePath = self._getCachedFilePath(path) if cache else None
+            if cachePath:
+                ret = os.path.join(destPath, self.storageConn.extractFilename(path)) if deriveFilename else destPath
+                shutil.copyfile(cachePath, ret)
+            else:
+                ret = self.storageConn.retrieveFilePath(path, destPath=destPath, deriveFilename=deriveFilename)
+            if ret and os.path.isfile(ret):
+                sp.addBytes(os.path.getsize(ret))
+        return ret
     
-    def retrieveJSON(self, path):
+    def retrieveJSON(self, path, cache=False):
         """
-        retrieveJSON(path) efficiently returns a dictionary representing JSON via a temporary file.
+        retrieveJSON(path) efficiently returns a dictionary representing JSON via a temporary file. Compressed JSON is
+        recognized and decompressed.
+        
+        @param cache: Set this to True to go through the object cache, for resources that are retrieved again and again
         """
+        if self.handoff:
+            ret = self.handoff.getJSON(self.repository, path)
+            if ret is not None:
+                return ret
         ret = None
         tempFilePath = tempfile.mktemp()
-        if self.retrieveFilePath(path, destPath=tempFilePath):
-            with open(tempFilePath, "r") as fileObj:
+        if self.retrieveFilePath(path, destPath=tempFilePath, cache=cache):
+            with perfmet.span("json_parse", os.path.getsize(tempFilePath)), \
+                    closing(compression.openReader(open(tempFilePath, "rb"))) as fileObj:
                 ret = json.load(fileObj)
         os.remove(tempFilePath)
         return ret
     
-    def retrieveBuffer(self, path):
+    def iterJSONRows(self, path, section="data"):
+        """
+        Generator that yields each row of the list in the given section of the JSON resource at the given path. The
+        resource is parsed incrementally as it is read, so that the whole document isn't held in memory.
+        """
+        if self.handoff:
+            sourceJSON = self.handoff.getJSON(self.repository, path)
+            if sourceJSON is not None:
+                yield from sourceJSON[section]
+                return
+        with closing(self._openReadStream(path)) as stream:
+            yield from perfmet.timedIter("json_stream_read", json_stream.iterRows(stream, section))
+    
+    def retrieveJSONSections(self, path, sections):
         """
-        retrieveBufferPath retrieves a resource at the given storage platform-specific path and provides it as a buffer.
+        Returns a dictionary of the given sections (such as "header" or "devices") of the JSON resource at the given
+        path. Other sections, such as a long list of data rows, are skipped over without being held in memory.
+        """
+        if self.handoff:
+            sourceJSON = self.handoff.getJSON(self.repository, path)
+            if sourceJSON is not None:
+                return {section: sourceJSON[section] for section in sections if section in sourceJSON}
+        with perfmet.span("json_stream_read"), closing(self._openReadStream(path)) as stream:
+            return json_stream.readSections(stream, sections)
+    
+    def _openReadStream(self, path):
+        """
+        Returns a binary stream for reading the resource at the given path.
+        """
+        if self.handoff:
+            holdPath = self.handoff.getFilePath(self.repository, path)
+            if holdPath:
+                return open(holdPath, "rb")
+        return self.storageConn.openReadStream(path)
+    
+    def _getCachedFilePath(self, path):
+        """
+        Returns the path to an up-to-date local copy of the resource from the object cache, or None if there's no
+        object cache or the resource isn't cached.
         """
-        return self.storageConn.retrieveBufferPath(path)
+        if not self.objectCache:
+            return None
+        return self.objectCache.getFilePath(self.repository, path, self.storageConn)
+    
+    def getSizes(self, paths):
+        """
+        Returns a dictionary of the given storage platform-specific paths to their sizes in bytes, found without
+        retrieving the resources. Paths that aren't found are left out.
+        """
+        return self.storageConn.getSizes(paths)
+    
+    def retrieveBuffer(self, path, cache=False, encoding=None):
+        """
+        retrieveBufferPath retrieves a resource at the given storage platform-specific path and provides it as a buffer.
+        
+        @param cache: Set this to True to go through the object cache, for resources that are retrieved again and again
+        @param encoding: The compression that the resource had been written with, as found in "encoding" of its
+          catalog element's metadata, or None to return it as it is
+        """
+        if self.handoff:
+            holdPath = self.handoff.getFilePath(self.repository, path)
+            if holdPath:
+                with open(holdPath, "rb") as fileObj:
+                    return compression.decodeBytes(fileObj.read(), encoding)
+        with perfmet.span("download") as sp:
+            cachePath = self._getCachedFilePath(path) if cache else None
+            if cachePath:
+                with open(cachePath, "rb") as fileObj:
+                    ret = fileObj.read()
+            else:
+                ret = self.storageConn.retrieveBufferPath(path)
+            if isinstance(ret, (bytes, bytearray)):
+                sp.addBytes(len(ret))
+        return compression.decodeBytes(ret, encoding) if ret else ret
         
     def writeFile(self, sourceFile, catalogElement, cacheCatalogFlag=False):
         """
@@ -94,34 +204,55 @@ class Storage:
         @param sourceFile: The full path to a file, or an open file object.
         @param catalogElement: A catalog element, which is updated to be relevant to this storage object.
         @param cacheCatalogFlag defers writing of contents to the catalog until flushCatalog() is called.
+        @return The catalog element that was written
         """
         with open(sourceFile, "rb") as fileObject:
-            self.writeBuffer(fileObject, catalogElement, cacheCatalogFlag=cacheCatalogFlag)
+            newCatalogElement = self.writeBuffer(fileObject, catalogElement, cacheCatalogFlag=cacheCatalogFlag)
+        if self.handoff:
+            self.handoff.putFile(self.repository, newCatalogElement["pointer"], sourceFile)
+        return newCatalogElement
             
     def writeJSON(self, sourceJSON, catalogElement, cacheCatalogFlag=False):
         """
-        writeJSON writes stringified JSON to the resource, streaming out to a temporary file to reduce RAM footprint
+        writeJSON writes stringified JSON to the resource, streaming out to a temporary file to reduce RAM footprint.
+        It is compressed if this object has an encoding.
+        
+        @return The catalog element that was written
         """
         tempFilePath = tempfile.mktemp()
-        with open(tempFilePath, "w") as outFile:
-            json.dump(sourceJSON, outFile)
-        self.writeFile(tempFilePath, catalogElement, cacheCatalogFlag)
-        os.remove(tempFilePath)
+        with perfmet.span("json_serialize") as sp:
+            if self.encoding:
+                with open(tempFilePath, "wb") as outFile, compression.openWriter(outFile, self.encoding) as compressFile, \
+                        io.TextIOWrapper(compressFile, encoding="utf-8") as textFile:
+                    json.dump(sourceJSON, textFile)
+            else:
+                with open(tempFilePath, "w") as outFile:
+                    json.dump(sourceJSON, outFile)
+            sp.addBytes(os.path.getsize(tempFilePath))
+        with open(tempFilePath, "rb") as fileObject:
+            newCatalogElement = self.writeBuffer(fileObject, catalogElement, cacheCatalogFlag=cacheCatalogFlag,
+                                                 contentType=JSON_CONTENT_TYPE, encoding=self.encoding)
+        if self.handoff:
+            self.handoff.putFile(self.repository, newCatalogElement["pointer"], tempFilePath, move=True)
+            self.handoff.putJSON(self.repository, newCatalogElement["pointer"], sourceJSON)
+        else:
+            os.remove(tempFilePath)
+        return newCatalogElement
         
-    def writeBuffer(self, sourceBuffer, catalogElement, cacheCatalogFlag=False):
+    def writeBuffer(self, sourceBuffer, catalogElement, cacheCatalogFlag=False, contentType=None, encoding=None):
         """
         writeBuffer writes the contents of the buffer into the resource specified by catalogObject (base, ext, etc.) until flushCatalog() is called.
         @param sourceFile: The full path to a file, or an open file object.
         @param catalogElement: A catalog element, which is updated to be relevant to this storage object.
         @param cacheCatalogFlag defers writing of contents to the catalog until flushCatalog() is called.
-        """
-        newCatalogElement = self.createCatalogElement(
-            catalogElement["id_base"],
-            catalogElement["id_ext"],
-            catalogElement["collection_date"],
-            processingDate=catalogElement["processing_date"] if "processing_date" in catalogElement else None,
-            metadata=catalogElement["metadata"] if "metadata" in catalogElement else None
-        )
+        @param contentType: The MIME type of the contents, if known, for storage platforms that label resources
+        @param encoding: The compression that the contents had been written with, which is recorded in the catalog
+          element's metadata and labels the resource
+        @return The catalog element that was written
+        """
+        if encoding:
+            catalogElement = self._withEncoding(catalogElement, encoding)
+        newCatalogElement = self._makeTargetCatalogElement(catalogElement)
         if self.writeFilePath:
             # We have a debug flag for writing out the file to a given path. Write it.
             filename = self.makeFilename(catalogElement["id_base"], catalogElement["id_ext"], arrow.get(catalogElement["collection_date"]))
@@ -131,17 +262,100 @@ class Storage:
                 outFile.flush()
             if not self.simulationMode:
                 # Use that written file to write to the storage repository.
-                self.storageConn.writeFile(debugPath, newCatalogElement["pointer"])
+                with perfmet.span("upload", os.path.getsize(debugPath)):
+                    self.storageConn.writeFile(debugPath, newCatalogElement["pointer"], contentType=contentType,
+                                               contentEncoding=encoding)
             else:
                 print("Simulation mode: skipped writing file '%s' to repository: '%s'" % (debugPath, newCatalogElement["pointer"]))
         else:
             if not self.simulationMode:
                 # Write the given buffer to the storage repository.
-                self.storageConn.writeBuffer(sourceBuffer, newCatalogElement["pointer"])
+                with perfmet.span("upload", _getBufferSize(sourceBuffer)):
+                    self.storageConn.writeBuffer(sourceBuffer, newCatalogElement["pointer"], contentType=contentType,
+                                                 contentEncoding=encoding)
             else:
                 print("Simulation mode: skipped writing buffer to repository: '%s'" % newCatalogElement["pointer"])
+        self._recordCatalogElement(newCatalogElement, cacheCatalogFlag)
+        return newCatalogElement
+    
+    def writeJSONStream(self, header, rows, catalogElement, extraSections=None, rowSection="data", cacheCatalogFlag=False):
+        """
+        writeJSONStream writes a JSON document to the resource while the rows are being produced, so that the whole
+        document doesn't need to be held in memory. The result is the same as what writeJSON() writes for
+        {"header": header, rowSection: list(rows), **extraSections}, including compression if this object has an
+        encoding.
+        
+        @param header: The dictionary that goes in the "header" section
+        @param rows: An iterable of rows for the rowSection list, such as a generator
+        @param catalogElement: A catalog element, which is updated to be relevant to this storage object.
+        @param extraSections: An optional dictionary of sections that follow the rows, in order
+        @param rowSection: The key that the list of rows goes under
+        @param cacheCatalogFlag defers writing of contents to the catalog until flushCatalog() is called.
+        @return The catalog element that was written
+        """
+        if self.writeFilePath or self.simulationMode or self.handoff:
+            # These need a local copy of the file, so write that out first and then use writeBuffer():
+            tempFilePath = tempfile.mktemp()
+            with perfmet.span("json_serialize") as sp:
+                with open(tempFilePath, "wb") as outFile:
+                    sp.addBytes(self._writeJSONDoc(outFile, header, rows, extraSections, rowSection))
+            with open(tempFilePath, "rb") as fileObject:
+                newCatalogElement = self.writeBuffer(fileObject, catalogElement, cacheCatalogFlag=cacheCatalogFlag,
+                                                     contentType=JSON_CONTENT_TYPE, encoding=self.encoding)
+            if self.handoff:
+                self.handoff.putFile(self.repository, newCatalogElement["pointer"], tempFilePath, move=True)
+            else:
+                os.remove(tempFilePath)
+            return newCatalogElement
+        
+        if self.encoding:
+            catalogElement = self._withEncoding(catalogElement, self.encoding)
+        newCatalogElement = self._makeTargetCatalogElement(catalogElement)
+        # Rows are serialized and uploaded together, so this also covers the time spent producing the rows:
+        with perfmet.span("json_stream") as sp:
+            with self.storageConn.openWriteStream(newCatalogElement["pointer"], contentType=JSON_CONTENT_TYPE,
+                                                  contentEncoding=self.encoding) as stream:
+                sp.addBytes(self._writeJSONDoc(stream, header, rows, extraSections, rowSection))
+        self._recordCatalogElement(newCatalogElement, cacheCatalogFlag)
+        return newCatalogElement
+    
+    def _writeJSONDoc(self, fileObj, header, rows, extraSections, rowSection):
+        """
+        Writes the JSON document for writeJSONStream() to the given binary file object, compressing it if this object
+        has an encoding. Returns the number of bytes before compression.
+        """
+        if not self.encoding:
+            return writeJSONDoc(fileObj.write, header, rows, extraSections, rowSection)
+        with compression.openWriter(fileObj, self.encoding) as compressFile:
+            return writeJSONDoc(compressFile.write, header, rows, extraSections, rowSection)
+    
+    def _withEncoding(self, catalogElement, encoding):
+        """
+        Returns a copy of the catalog element with the given encoding recorded in the metadata.
+        """
+        metadata = dict(catalogElement["metadata"]) if "metadata" in catalogElement and catalogElement["metadata"] else {}
+        metadata["encoding"] = encoding
+        ret = dict(catalogElement)
+        ret["metadata"] = metadata
+        return ret
+    
+    def _makeTargetCatalogElement(self, catalogElement):
+        """
+        Returns a new catalog element for this storage object that has the identity of the given catalog element.
+        """
+        return self.createCatalogElement(
+            catalogElement["id_base"],
+            catalogElement["id_ext"],
+            catalogElement["collection_date"],
+            processingDate=catalogElement["processing_date"] if "processing_date" in catalogElement else None,
+            metadata=catalogElement["metadata"] if "metadata" in catalogElement else None
+        )
+    
+    def _recordCatalogElement(self, newCatalogElement, cacheCatalogFlag):
+        """
+        Adds the catalog element for something that was just written to the target catalog.
+        """
         if not self.simulationMode and self.catalog:
-            # Add this new entry to the target catalog:
             if cacheCatalogFlag:
                 self.catalog.stageUpsert(newCatalogElement)
             else:
@@ -177,7 +391,7 @@ class Storage:
         Creates a catalog object based upon the given criteria. Used for providing parameters for writing a file.
         """
         return self.catalog.buildCatalogElement(self.repository, base, ext, collectionDate, processingDate, \
-            self.makePath(base, ext, collectionDate), metadata)
+            self.makePath(base, ext, collectionDate), metadata=metadata)
 
 BIN_BUFFER_SIZE = 1024
 "Used in the writeFromBinBuffer() function."
@@ -194,6 +408,47 @@ def writeFromBinBuffer(readBuffer, writeBuffer):
         else:
             break
 
+def writeJSONDoc(write, header, rows, extraSections=None, rowSection="data"):
+    """
+    Serializes {"header": header, rowSection: rows, **extraSections} one row at a time, giving the same text as
+    json.dump() with default settings. The rows can be any iterable.
+    
+    @param write: A function that takes each piece of the document as bytes
+    @return The number of bytes written
+    """
+    encoder = json.JSONEncoder()
+    count = 0
+    def writeStr(text):
+        nonlocal count
+        data = text.encode("utf-8")
+        write(data)
+        count += len(data)
+    
+    writeStr('{"header": ' + encoder.encode(header) + ", " + encoder.encode(rowSection) + ": [")
+    separator = ""
+    for row in rows:
+        writeStr(separator + encoder.encode(row))
+        separator = ", "
+    writeStr("]")
+    if extraSections:
+        for key, value in extraSections.items():
+            writeStr(", " + encoder.encode(key) + ": ")
+            for chunk in encoder.iterencode(value):
+                writeStr(chunk)
+    writeStr("}")
+    return count
+
+def _getBufferSize(sourceBuffer):
+    """
+    Returns the number of bytes in the given buffer or open file object, or 0 if that can't be found without reading it.
+    """
+    if isinstance(sourceBuffer, (bytes, bytearray)):
+        return len(sourceBuffer)
+    try:
+        return os.fstat(sourceBuffer.fileno()).st_size - sourceBuffer.tell()
+    except (AttributeError, OSError, ValueError):
+        return 0
+
 class StorageImpl:
     """
     Implements storage access functions for a specific storage platform
@@ -228,15 +483,110 @@ class StorageImpl:
         retrieveBufferPath retrieves a resource at the given storage platform-specific path and provides it as a buffer.
         """
         raise NotImplementedError
+    
+    def getSizes(self, paths):
+        """
+        Returns a dictionary of the given target platform-dependent paths to their sizes in bytes. Paths that aren't
+        found are left out.
+        """
+        raise NotImplementedError
+    
+    def getValidator(self, path):
+        """
+        Returns a tuple of a version tag (such as an ETag) and the size in bytes for the resource at the given target
+        platform-dependent path, which changes whenever the resource does. This default returns None, which means
+        that resources aren't cached in an object_cache.ObjectCache.
+        """
+        return None
         
-    def writeFile(self, sourceFile, path):
+    def writeFile(self, sourceFile, path, contentType=None, contentEncoding=None):
         """
         writeFile writes sourceFile to the target fully specified target platform-dependent path.
+        
+        @param contentType: The MIME type of the contents, if known
+        @param contentEncoding: The compression of the contents (e.g. "gzip"), if any
         """
         raise NotImplementedError
         
-    def writeBuffer(self, sourceBuffer, path):
+    def writeBuffer(self, sourceBuffer, path, contentType=None, contentEncoding=None):
         """
         writeBuffer writes the contents of the buffer into the target fully specified target platform-dependent path.
+        
+        @param contentType: The MIME type of the contents, if known
+        @param contentEncoding: The compression of the contents (e.g. "gzip"), if any
         """
         raise NotImplementedError
+    
+    def openReadStream(self, path):
+        """
+        Returns a binary stream for reading the resource at the given target platform-dependent path. This default
+        retrieves the resource to a temporary file, which is removed when the stream is closed.
+        """
+        tempFilePath = tempfile.mktemp()
+        self.retrieveFilePath(path, destPath=tempFilePath)
+        return _TempReadFile(tempFilePath)
+    
+    def openWriteStream(self, path, contentType=None, contentEncoding=None):
+        """
+        Returns a writable stream for the target fully specified target platform-dependent path, for use in a "with"
+        statement. The resource is written when the "with" block ends, or is abandoned if an exception occurs. This
+        default collects the data in a SpooledWriteStream and then calls writeBuffer().
+        """
+        return SpooledWriteStream(self, path, contentType, contentEncoding)
+
+class _TempReadFile(io.FileIO):
+    """
+    A file that is opened for reading and removed when closed.
+    """
+    def __init__(self, path):
+        super().__init__(path, "rb")
+        
+    def close(self):
+        super().close()
+        if os.path.exists(self.name):
+            os.remove(self.name)
+
+"SPOOL_MAX_BYTES is the amount of data that a SpooledWriteStream holds in memory before moving it to a temporary file."
+SPOOL_MAX_BYTES = 16 * 1024 * 1024
+
+class SpooledWriteStream:
+    """
+    Collects bytes that are written for a StorageImpl path, and writes them out with StorageImpl.writeBuffer() upon
+    successful close.
+    """
+    def __init__(self, storageImpl, path, contentType=None, contentEncoding=None):
+        self.storageImpl = storageImpl
+        self.path = path
+        self.contentType = contentType
+        self.contentEncoding = contentEncoding
+        self.spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        
+    def write(self, data):
+        self.spool.write(data)
+        
+    def close(self):
+        """
+        Writes out what had been collected.
+        """
+        self.spool.seek(0)
+        try:
+            self.storageImpl.writeBuffer(self.spool, self.path, contentType=self.contentType,
+                                         contentEncoding=self.contentEncoding)
+        finally:
+            self.spool.close()
+    
+    def abort(self):
+        """
+        Discards what had been collected.
+        """
+        self.spool.close()
+        
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, excType, excValue, tb):
+        if excType:
+            self.abort()
+        else:
+            self.close()
+        return False
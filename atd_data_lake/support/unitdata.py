@@ -4,7 +4,7 @@ unitData.py: Utility functions and classes for unit data storage and accessing
 @author Kenneth Perrine
 """
 import datetime
-import json
+import threading
 
 import arrow
 
@@ -24,12 +24,14 @@ class UnitDataStorage:
         self.storageObject = storageObject
         self.areaBase = areaBase
         self.unitDataCatList = None
-        self.prevIndex = None
+        self.prevPointer = None
         self.prevUnitData = None
+        self.lock = threading.Lock()
     
     def prepare(self, dateEarliest=None, dateLatest=None):
         """
-        Searches the catalog for relevant unit data that is relevant to the date constraints if given
+        Searches the catalog for relevant unit data that is relevant to the date constraints if given. This can be
+        called again (e.g. for the next daemon cycle) while keeping the unit data that had last been retrieved.
         """
         self.unitDataCatList = self.storageObject.catalog.getSearchableQueryList(self.storageObject.repository, self.areaBase,
                                             "unit_data.json", dateEarliest, dateLatest,
@@ -43,6 +45,13 @@ class UnitDataStorage:
         
         @return Path to the written unit data file if writeFile is true; otherwise, the in-memory dictionary.
         """        
+        with self.lock:
+            return self._retrieve(date)
+    
+    def _retrieve(self, date):
+        """
+        Performs retrieve() while the lock is held, so that concurrent workers see consistent cached unit data.
+        """
         # If prepare was never called, we'll just retrieve the latest unit data:
         if not self.unitDataCatList:
             self.prepare()
@@ -53,13 +62,14 @@ class UnitDataStorage:
         unitDataCatIndex = self.unitDataCatList.getNextDateIndex(date) if date else len(self.unitDataCatList.catalogElements) - 1 
         if unitDataCatIndex >= len(self.unitDataCatList.catalogElements) or unitDataCatIndex < 0:
             return None
-        if unitDataCatIndex == self.prevIndex:
+        pointer = self.unitDataCatList.catalogElements[unitDataCatIndex]["pointer"]
+        if pointer == self.prevPointer:
             return self.prevUnitData
         
         # Get the unit data:
-        buffer = self.storageObject.retrieveBuffer(self.unitDataCatList.catalogElements[unitDataCatIndex]["pointer"])
-        self.prevIndex = unitDataCatIndex
-        self.prevUnitData = json.loads(buffer)
+        unitData = self.storageObject.retrieveJSON(pointer, cache=True)
+        self.prevPointer = pointer
+        self.prevUnitData = unitData
         return self.prevUnitData
         # TODO: Re-make the header, or check the integrity of the existing header.
 
@@ -6,6 +6,7 @@ Kenneth Perrine - The University of Texas at Austin
 
 import arrow
 import datetime as dt
+import functools
 from dateutil.tz import tzutc
 import pytz
 
@@ -16,6 +17,11 @@ TODO: Use the tzlocal package to get the local timezone in pytz form so localize
 """
 LOCAL_TIMEZONE = dt.datetime.now(dt.timezone.utc).astimezone().tzinfo
 
+"""
+EPOCH is the reference point for toEpochMicros().
+"""
+EPOCH = dt.datetime(1970, 1, 1, tzinfo=dt.timezone.utc)
+
 """
 EARLIEST_TIME is the default time that is provided as a default from parseDate when 0 is given.
 """
@@ -78,6 +84,36 @@ def localize(dateTime):
     else:    
         return dateTime.astimezone(LOCAL_TIMEZONE)    
     
+@functools.lru_cache(maxsize=4096)
+def parseISOLocal(dateString):
+    """
+    Parses an ISO-8601 timestamp string, such as those returned by the catalog, and translates it to local time. This
+    gives the same result as localize(arrow.get(dateString).datetime), where no time zone means UTC, but is much faster
+    and remembers recent values. Strings that the standard library can't parse are passed on to arrow.
+    """
+    ret = None
+    dotPos = dateString.find(".")
+    if dotPos < 0 or len(dateString) - dotPos <= 7 or not dateString[dotPos + 1:dotPos + 8].isdigit():
+        # Finer fractions than microseconds are rounded by arrow but truncated by fromisoformat(), so leave those to arrow.
+        try:
+            ret = dt.datetime.fromisoformat(dateString)
+        except ValueError:
+            pass
+    if ret is None:
+        ret = arrow.get(dateString).datetime
+    if ret.tzinfo is None:
+        ret = ret.replace(tzinfo=dt.timezone.utc)
+    return localize(ret)
+
+def toEpochMicros(dateTime):
+    """
+    Returns the given dateTime as an integer number of microseconds since the epoch, for compact storage and exact
+    comparisons. If no time zone information is given, then the local time zone is assumed.
+    """
+    if dateTime.tzinfo is None or dateTime.tzinfo.utcoffset(dateTime) is None:
+        dateTime = localize(dateTime)
+    return (dateTime - EPOCH) // dt.timedelta(microseconds=1)
+
 def localOverwrite(dateTime):
     """
     Overwrites timezone information (or naivete) to local time.
@@ -91,6 +127,7 @@ def setLocalTimezone(timeZoneString):
     global LOCAL_TIMEZONE
     if timeZoneString:
         LOCAL_TIMEZONE = pytz.timezone(timeZoneString)
+        parseISOLocal.cache_clear()
 
 def roundDay(timestampIn):
     """
@@ -20,6 +20,9 @@ class GSAggPublishApp(etl_app.ETLApp):
     """
     Application functions and special behavior around Wavetronix exporting to Socrata.
     """
+    # The publisher is shared between items.
+    parallelItems = False
+    
     def __init__(self, args):
         """
         Initializes application-specific variables
@@ -54,10 +57,9 @@ class GSAggPublishApp(etl_app.ETLApp):
         """
         # Read in the file and call the transformation code.
         print("%s: %s -> %s" % (item.label, self.storageSrc.repository, self.publisher.connector.getIdentifier()))
-        data = self.storageSrc.retrieveJSON(item.label)
 
-        # Assemble JSON for the publisher:
-        for line in data["data"]:            
+        # Assemble JSON for the publisher as rows are read in:
+        for line in self.storageSrc.iterJSONRows(item.label):
             timestamp = arrow.get(line["curDateTime"])
             direction = line["detName"].split("_")
             direction = direction[0] if direction else ""
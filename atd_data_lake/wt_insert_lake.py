@@ -20,6 +20,9 @@ class WTInsertLakeApp(etl_app.ETLApp):
     """
     Application functions and special behavior around Wavetronix database ingestion.
     """
+    # The database connection is shared between items.
+    parallelItems = False
+    
     def __init__(self, args):
         """
         Initializes application-specific variables
@@ -31,6 +34,12 @@ class WTInsertLakeApp(etl_app.ETLApp):
                          needsTempDir=True,
                          perfmetStage="Ingest")
 
+    def _addCustomArgs(self, parser):
+        """
+        Override this and call parser.add_argument() to add custom command-line arguments.
+        """
+        parser.add_argument("--probe_cache", help="path to a file that retains which days were found to have records between runs")
+
     def etlActivity(self):
         """
         This performs the main ETL processing.
@@ -41,7 +50,8 @@ class WTInsertLakeApp(etl_app.ETLApp):
         wtDB = wt_mssql_db.WT_MSSQL_DB()
         
         # Configure the source and target repositories and start the compare loop:
-        self.wtProvider = last_update_db.LastUpdDB(wtDB, config.getUnitLocation())
+        # Rather than aggregating over the whole table, each day in the time range is probed for records:
+        self.wtProvider = last_update_db.LastUpdDBInterval(wtDB, config.getUnitLocation(), probeCache=getattr(self.args, "probe_cache", None))
         count = self.doCompareLoop(self.wtProvider,
                                    last_update.LastUpdStorageCatProv(self.storageTgt),
                                    baseExtKey=False)
@@ -19,6 +19,9 @@ class WTJSONStandardApp(etl_app.ETLApp):
     """
     Application functions and special behavior around Wavetronix JSON canonicalization.
     """
+    # Unit data is written with the first item, and sensor observations are shared.
+    parallelItems = False
+    
     def __init__(self, args):
         """
         Initializes application-specific variables
@@ -37,8 +40,7 @@ class WTJSONStandardApp(etl_app.ETLApp):
         @return count: A general number of records processed
         """
         # First, get the unit data for Wavetronix:
-        unitDataProv = config.createUnitDataAccessor(self.dataSource)
-        self.unitData = unitDataProv.retrieve()
+        self.unitData = self.retrieveUnitData()
                 
         # Configure the source and target repositories and start the compare loop:
         count = self.doCompareLoop(last_update.LastUpdStorageCatProv(self.storageSrc),
@@ -58,16 +60,16 @@ class WTJSONStandardApp(etl_app.ETLApp):
         # Read in the file and call the transformation code.
         print("%s: %s -> %s" % (item.label, self.storageSrc.repository, self.storageTgt.repository))
         filepathSrc = self.storageSrc.retrieveFilePath(item.label)
-        outJSON, perfWork = wtStandardize(item, filepathSrc,
+        header, rows, perfWork = wtStandardize(item, filepathSrc,
             self.storageTgt.makeFilename(item.identifier.base, "json", item.identifier.date), self.processingDate)
 
-        # Clean up:
-        os.remove(filepathSrc)
-        
-        # Prepare for writing to the target:
+        # Write to the target as the rows are read in:
         catalogElement = self.storageTgt.createCatalogElement(item.identifier.base, "json",
                                                               item.identifier.date, self.processingDate)
-        self.storageTgt.writeJSON(outJSON, catalogElement)
+        self.storageTgt.writeJSONStream(header, rows, catalogElement)
+
+        # Clean up:
+        os.remove(filepathSrc)
             
         # Final stages:
         self.perfmet.recordCollect(item.identifier.date, representsDay=True)
@@ -80,7 +82,9 @@ class WTJSONStandardApp(etl_app.ETLApp):
 
 def wtStandardize(storageItem, filepathSrc, filenameTgt, processingDate):
     """
-    Performs the actual Wavetronix standardization, which is basically doing a direct translation from CSV to JSON
+    Performs the actual Wavetronix standardization, which is basically doing a direct translation from CSV to JSON.
+    Returns the header, an iterator of data rows that are read in as they are consumed, and performance metrics work,
+    which is complete once all rows are consumed.
     """
     # Define header:
     jsonHeader = {"data_type": "wavetronix",
@@ -89,24 +93,31 @@ def wtStandardize(storageItem, filepathSrc, filenameTgt, processingDate):
                   "collection_date": str(storageItem.identifier.date),
                   "processing_date": str(processingDate)}
 
-    # Read in the file:
-    data = []
+    # The file is read in as rows are consumed:
     perfWork = {} # This will be sensor -> [count, minTime, maxTime]
+    rows = _wtReadRows(filepathSrc, perfWork)
+    return jsonHeader, perfmet.timedIter("transform", rows), perfWork
+
+def _wtReadRows(filepathSrc, perfWork):
+    """
+    Generator that reads in the Wavetronix file and yields each translated row, collecting performance metrics work
+    along the way.
+    """
     with open(filepathSrc, "rt") as fileReader:
         reader = csv.DictReader(fileReader)
         for row in reader:
-            data.append({"detID": int(row["detID"]),
-                         "intID": int(row["intID"]),
-                         "curDateTime": str(date_util.localize(datetime.datetime.strptime(row["curDateTime"], "%Y-%m-%d %H:%M:%S"))),
-                         "intName": row["intName"],
-                         "detName": row["detName"],
-                         "volume": int(row["volume"]),
-                         "occupancy": int(row["occupancy"]),
-                         "speed": int(row["speed"]),
-                         "status": row["status"],
-                         "uploadSuccess": int(row["uploadSuccess"]),
-                         "detCountComparison": int(row["detCountComparison"]),
-                         "dailyCumulative": int(row["dailyCumulative"])})
+            yield {"detID": int(row["detID"]),
+                   "intID": int(row["intID"]),
+                   "curDateTime": str(date_util.localize(datetime.datetime.strptime(row["curDateTime"], "%Y-%m-%d %H:%M:%S"))),
+                   "intName": row["intName"],
+                   "detName": row["detName"],
+                   "volume": int(row["volume"]),
+                   "occupancy": int(row["occupancy"]),
+                   "speed": int(row["speed"]),
+                   "status": row["status"],
+                   "uploadSuccess": int(row["uploadSuccess"]),
+                   "detCountComparison": int(row["detCountComparison"]),
+                   "dailyCumulative": int(row["dailyCumulative"])}
             
             # Performance metrics:
             if row["intName"] and str(row["intName"] != "nan"):
@@ -119,11 +130,6 @@ def wtStandardize(storageItem, filepathSrc, filenameTgt, processingDate):
                         recs[1] = row["curDateTime"]
                     elif row["curDateTime"] > recs[2]:
                         recs[2] = row["curDateTime"]
-                
-    # We're complete!
-    ret = {"header": jsonHeader,
-           "data": data}
-    return ret, perfWork 
 
 def main(args=None):
     """
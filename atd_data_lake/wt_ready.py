@@ -8,8 +8,7 @@ import hashlib
 import pandas as pd
 
 import _setpath
-from atd_data_lake.support import etl_app, last_update
-from atd_data_lake import config
+from atd_data_lake.support import etl_app, last_update, perfmet
 
 # This sets up application information:
 APP_DESCRIPTION = etl_app.AppDescription(
@@ -38,8 +37,7 @@ class WTReadyApp(etl_app.ETLApp):
         @return count: A general number of records processed
         """
         # First, get the unit data for Wavetronix:
-        self.unitDataProv = config.createUnitDataAccessor(self.storageSrc)
-        self.unitDataProv.prepare(self.startDate, self.endDate)
+        self.unitDataProv = self.retrieveUnitDataProv(self.storageSrc)
         
         # Configure the source and target repositories and start the compare loop:
         count = self.doCompareLoop(last_update.LastUpdStorageCatProv(self.storageSrc),
@@ -61,8 +59,9 @@ class WTReadyApp(etl_app.ETLApp):
         
         # Read in the file and call the transformation code.
         print("%s: %s -> %s" % (item.label, self.storageSrc.repository, self.storageTgt.repository))
-        data = self.storageSrc.retrieveJSON(item.label)
-        outJSON = wtReady(unitData, data, self.processingDate)
+        # The rows all go into a DataFrame anyway, so the file is read in one pass rather than streamed:
+        sourceJSON = self.storageSrc.retrieveJSON(item.label)
+        outJSON = wtReady(unitData, sourceJSON["header"], sourceJSON["data"], self.processingDate)
 
         # Prepare for writing to the target:
         catalogElement = self.storageTgt.createCatalogElement(item.identifier.base, "json",
@@ -83,16 +82,19 @@ def _createHash(row):
     hasher.update(bytes(toHash, "utf-8"))
     return hasher.hexdigest()
 
-def wtReady(unitData, data, processingDate):
+@perfmet.timed("transform")
+def wtReady(unitData, header, rows, processingDate):
     """
     Transforms Wavetronix data to "ready" JSON along with the unit data.
+    
+    @param header: The header from the source file
+    @param rows: An iterable of the data rows from the source file
     """
     # Step 1: Prepare header:
-    header = data["header"]
     header["processing_date"] = str(processingDate)    
 
     # Step 2: Convert the data and devices to Pandas dataframes:
-    data = pd.DataFrame(data["data"])
+    data = pd.DataFrame(rows)
     devices = pd.DataFrame(unitData["devices"])
     
     # Step 3: Tie device information to data rows: